@@ -0,0 +1,308 @@
+#
+# SPDX-FileName: backtest.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Rolling-origin backtest of the material models.
+
+Usage:
+    python backtest.py [--materials high_carbon copper] [--origins 8] [--step 3] [--cutoffs 2021-01 ...]
+                       [--horizons 1 3 6 12 24] [--bom high_carbon=2 copper=1.5] [--workers 4]
+                       [--checkpoint backtest.jsonl] [--output backtest.json]
+
+For every cutoff, each material's model is fitted from scratch on the history
+in `data/` up to the cutoff, with the configuration of its pickle in
+`models/`, and forecast `max(horizons)` months ahead. Forecasts are compared
+with the observed prices `h` months after the cutoff, giving MAPE and RMSE per
+material and horizon, and for a BOM priced from all materials. The cutoffs of
+a material are the `--origins` latest months of a grid spaced `--step` months
+apart that lie at least `max(horizons)` months before its own last
+observation, so every horizon can be scored at every cutoff. All materials
+share the grid, and the BOM is scored at the cutoffs all of its materials
+have. Cutoffs given with `--cutoffs` are used for every material whose history
+continues after them.
+
+The fits run on a pool of processes. Every finished fit is appended to the
+checkpoint file, and fits already in it are skipped, so an interrupted run
+resumes where it stopped. A checkpointed fit is only reused while the model
+file, history and settings it was made with are unchanged.
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from catalog import catalog
+from forecast_cache import DATA_DIR
+from model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZONS = (1, 3, 6, 12, 24)
+CHECKPOINT_PATH = 'backtest.jsonl'
+
+
+def read_history(material):
+    history = pd.read_csv(os.path.join(DATA_DIR, material.csv + '.csv'), parse_dates=['ds'])
+    return history[['ds', 'y']].dropna().sort_values('ds').reset_index(drop=True)
+
+
+def fit_from_scratch(model_path, history, epochs=None, learning_rate=0.01):
+    """
+    Fit a new model with the configuration of the model in `model_path` on `history`.
+
+    The pickle is reset to its unfitted configuration, so the fit builds a new
+    network. Epochs and batch size are chosen for the size of `history` as in
+    the original fit, unless `epochs` is given. A fixed learning rate skips the
+    learning rate search.
+    """
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    model.config_trend.changepoints = None
+    model.config_train.epochs = epochs
+    model.config_train.batch_size = None
+    model.config_train.learning_rate = learning_rate
+    model.fitted = False
+    model.fit(history, freq='MS', minimal=True)
+    return model
+
+
+def _init_worker():
+    import torch
+    from neuralprophet import set_log_level
+
+    # Each process fits one small model; more threads per process only compete for the cores
+    torch.set_num_threads(1)
+    set_log_level('ERROR')
+    logging.getLogger('lightning.pytorch').setLevel(logging.ERROR)
+
+
+def backtest_origin(material_name, cutoff, horizon, epochs, learning_rate):
+    """Forecast of one material fitted on its history up to `cutoff`, as a checkpoint record."""
+    material = catalog[material_name]
+    history = read_history(material)
+    history = history[history['ds'] <= pd.Timestamp(cutoff)]
+    model = fit_from_scratch(registry.path(material.model), history, epochs, learning_rate)
+    forecast = model.predict(model.make_future_dataframe(history, periods=horizon))
+    return {"material": material_name, "cutoff": cutoff,
+            "ds": forecast['ds'].dt.strftime('%Y-%m-%d').tolist(), "yhat1": forecast['yhat1'].tolist()}
+
+
+def task_key(material, cutoff, horizon, epochs, learning_rate):
+    """What a checkpointed fit depends on: the inputs, the model and history files and the settings."""
+    csv_stat = os.stat(os.path.join(DATA_DIR, material.csv + '.csv'))
+    return [material.name, cutoff, list(registry.signature(material.model)),
+            [csv_stat.st_mtime_ns, csv_stat.st_size], horizon, epochs, learning_rate]
+
+
+def read_checkpoint(path):
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interrupted run
+            records[json.dumps(record['key'])] = record
+    return records
+
+
+def open_checkpoint(path):
+    f = open(path, 'a+')
+    # Start on a new line after a line cut short by an interrupted run
+    if f.tell():
+        f.seek(f.tell() - 1)
+        if f.read(1) != '\n':
+            f.write('\n')
+    return f
+
+
+def append_checkpoint(f, record):
+    f.write(json.dumps(record) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def default_cutoffs(materials, origins, step, horizon):
+    """Cutoffs per material name, ending at least `horizon` months before the material's last observation."""
+    limits = {material.name: read_history(material)['ds'].max() - pd.DateOffset(months=horizon)
+              for material in materials}
+    anchor = max(limits.values())
+    cutoffs = {}
+    for name, limit in limits.items():
+        # The latest month of the common grid that is not after the limit of the material
+        first = -(-((anchor.year - limit.year) * 12 + anchor.month - limit.month) // step)
+        cutoffs[name] = [(anchor - pd.DateOffset(months=step * index)).strftime('%Y-%m-%d')
+                         for index in range(first + origins - 1, first - 1, -1)]
+    return cutoffs
+
+
+def given_cutoffs(materials, cutoffs):
+    """The cutoffs per material name that lie before the material's last observation."""
+    cutoffs = [pd.Timestamp(cutoff) for cutoff in cutoffs]
+    selected = {}
+    for material in materials:
+        latest = read_history(material)['ds'].max()
+        selected[material.name] = [cutoff.strftime('%Y-%m-%d') for cutoff in cutoffs if cutoff < latest]
+        if len(selected[material.name]) < len(cutoffs):
+            logger.warning("%s: skipping cutoffs after its last observation %s", material.name,
+                           latest.strftime('%Y-%m'))
+    return selected
+
+
+def run(materials, cutoffs, horizons, epochs=None, learning_rate=0.01, workers=None, checkpoint=CHECKPOINT_PATH):
+    """
+    Fit every material at each of its cutoffs, reusing checkpointed fits.
+
+    Args:
+        cutoffs (dict): Cutoff dates per material name.
+
+    Returns:
+        list: One record per material and cutoff with the forecast months and values.
+    """
+    horizon = max(horizons)
+    records = read_checkpoint(checkpoint)
+    tasks = {}
+    wanted = {json.dumps(task_key(material, cutoff, horizon, epochs, learning_rate)): (material, cutoff)
+              for material in materials for cutoff in cutoffs[material.name]}
+    for name, (material, cutoff) in wanted.items():
+        if name not in records:
+            tasks[name] = (json.loads(name), (material.name, cutoff, horizon, epochs, learning_rate))
+    logger.info("%d fits, %d from the checkpoint", len(wanted), len(wanted) - len(tasks))
+
+    if tasks:
+        with open_checkpoint(checkpoint) as f, \
+                ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker) as pool:
+            futures = {pool.submit(backtest_origin, *arguments): (name, key)
+                       for name, (key, arguments) in tasks.items()}
+            for done, future in enumerate(as_completed(futures), 1):
+                name, key = futures[future]
+                record = dict(future.result(), key=key)
+                append_checkpoint(f, record)
+                records[name] = record
+                logger.info("%d/%d: %s at %s", done, len(futures), record['material'], record['cutoff'])
+
+    return [record for name, record in records.items() if name in wanted]
+
+
+def errors(records, materials, horizons):
+    """Forecast and observed price of every material, cutoff and horizon where the month was observed."""
+    observed = {material.name: read_history(material).set_index('ds')['y'] for material in materials}
+    rows = []
+    for record in records:
+        forecast = pd.Series(record['yhat1'], index=pd.to_datetime(record['ds']))
+        cutoff = pd.Timestamp(record['cutoff'])
+        for h in horizons:
+            month = cutoff + pd.DateOffset(months=h)
+            if month in forecast.index and month in observed[record['material']].index:
+                rows.append((record['material'], record['cutoff'], h,
+                             forecast[month], observed[record['material']][month]))
+    return pd.DataFrame(rows, columns=['material', 'cutoff', 'horizon', 'yhat1', 'y'])
+
+
+def bom_errors(frame, bom):
+    """Priced BOM per cutoff and horizon, where every material of the BOM was observed."""
+    frame = frame[frame['material'].isin(list(bom))].copy()
+    weights = frame['material'].map(bom)
+    frame['yhat1'] *= weights
+    frame['y'] *= weights
+    grouped = frame.groupby(['cutoff', 'horizon'])
+    totals = grouped[['yhat1', 'y']].sum()[grouped.size() == len(bom)]
+    return totals.reset_index()
+
+
+def accuracy(frame, by):
+    """MAPE in percent, RMSE and the number of forecasts per group."""
+    error = frame['yhat1'] - frame['y']
+    scores = pd.DataFrame({
+        'ape': (error / frame['y']).abs() * 100,
+        'se': error ** 2,
+    }).assign(**{column: frame[column] for column in by})
+    grouped = scores.groupby(by)
+    return pd.DataFrame({'mape': grouped['ape'].mean(), 'rmse': np.sqrt(grouped['se'].mean()),
+                         'n': grouped.size()})
+
+
+def parse_bom(items, materials):
+    if not items:
+        return {material.name: 1.0 for material in materials}
+    bom = {}
+    for item in items:
+        name, _, weight = item.partition('=')
+        bom.update(catalog.arguments({name: float(weight)}))
+    unknown = [name for name in bom if name not in {material.name for material in materials}]
+    if unknown:
+        raise SystemExit(f"The BOM uses materials that are not backtested: {', '.join(unknown)}")
+    return bom
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the material models.")
+    parser.add_argument('--materials', nargs='+', choices=[material.name for material in catalog],
+                        help="Materials to backtest (default: all with a model and history)")
+    parser.add_argument('--origins', type=int, default=8, help="Number of cutoffs (default 8)")
+    parser.add_argument('--step', type=int, default=3, help="Months between cutoffs (default 3)")
+    parser.add_argument('--cutoffs', nargs='+', help="Explicit cutoff months, e.g. 2021-01")
+    parser.add_argument('--horizons', nargs='+', type=int, default=list(DEFAULT_HORIZONS),
+                        help="Months after the cutoff to evaluate (default 1 3 6 12 24)")
+    parser.add_argument('--bom', nargs='+', metavar='MATERIAL=WEIGHT',
+                        help="Weights of the evaluated BOM (default one unit of each material)")
+    parser.add_argument('--epochs', type=int, help="Training epochs per fit (default: chosen by NeuralProphet)")
+    parser.add_argument('--learning-rate', type=float, default=0.01, help="Learning rate (default 0.01)")
+    parser.add_argument('--workers', type=int, help="Fitting processes (default: one per core)")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help="Checkpoint file (default backtest.jsonl)")
+    parser.add_argument('--output', help="Write the accuracy tables as JSON to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('NP').setLevel(logging.ERROR)
+
+    names = args.materials or [material.name for material in catalog]
+    materials = [catalog[name] for name in names
+                 if os.path.exists(registry.path(catalog[name].model))
+                 and os.path.exists(os.path.join(DATA_DIR, catalog[name].csv + '.csv'))]
+    if not materials:
+        raise SystemExit("No material has both a model and a history file.")
+    bom = parse_bom(args.bom, materials)
+    cutoffs = (given_cutoffs(materials, args.cutoffs) if args.cutoffs
+               else default_cutoffs(materials, args.origins, args.step, max(args.horizons)))
+
+    records = run(materials, cutoffs, args.horizons, args.epochs, args.learning_rate, args.workers,
+                  args.checkpoint)
+    frame = errors(records, materials, args.horizons)
+    per_material = accuracy(frame, ['material', 'horizon'])
+    per_bom = accuracy(bom_errors(frame, bom), ['horizon'])
+
+    for metric, title in (('mape', 'MAPE'), ('rmse', 'RMSE'), ('n', 'Forecasts scored')):
+        print(f"\n{title} per material and horizon (months)")
+        print(per_material[metric].unstack('horizon').to_string(float_format='%.2f'))
+    print(f"\nBOM {json.dumps(bom)}")
+    if per_bom.empty:
+        print("No cutoff is shared by all materials of the BOM; use more --origins or give --cutoffs.")
+    else:
+        print(per_bom.to_string(float_format='%.2f'))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "cutoffs": cutoffs,
+                "horizons": args.horizons,
+                "bom": bom,
+                "materials": [dict(zip(('material', 'horizon'), index), **row)
+                              for index, row in per_material.to_dict('index').items()],
+                "bom_accuracy": [dict(horizon=horizon, **row) for horizon, row in per_bom.to_dict('index').items()],
+            }, f, indent=2, default=lambda value: value.item())
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+#
+# SPDX-FileName: pricing.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Latency and throughput benchmark of the pricing endpoints.
+
+Usage (from the repository root):
+    python benchmarks/pricing.py [--requests 200] [--concurrency 1] [--url http://127.0.0.1:8080]
+                                 [--output pricing.json]
+
+Without `--url` the app is driven in-process through FastAPI's TestClient, so
+the benchmark runs fully offline; with `--url` it targets a local uvicorn. The
+scenarios are a single material, the full bill of materials with spot prices,
+a long horizon, /plot/ and a batch call. Every GET request uses a different
+weight, so its response never comes from the result or chart cache; the
+forecasts themselves are cached as in the service. For each, latency percentiles,
+requests per second and peak RSS are reported. In-process runs also break the
+work down into the stages of a live forecast: model load, history read,
+future dataframe construction, predict, spot rescaling and serialization.
+Before timing, every line of a batch mixing the available materials is checked
+against the /calculate/ answer for its BOM alone.
+
+`FORECAST_SOURCE` and the other settings of the service apply as usual.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+os.chdir(REPOSITORY)
+
+from catalog import catalog  # noqa: E402
+from forecast_cache import forecast_cache  # noqa: E402
+from model_registry import current_rss  # noqa: E402
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def available_materials():
+    return [material for material in catalog if forecast_cache.available(material.model, material.csv)]
+
+
+def bom(materials, months, spot=True):
+    """Query parameters pricing one unit of each material, with a spot price where accepted."""
+    parameters = {material.aliases[0]: 1.0 for material in materials}
+    if spot:
+        parameters.update({'p_' + material.aliases[0]: 100.0 for material in materials if material.spot_price})
+    parameters['months'] = months
+    return parameters
+
+
+def scenarios(batch_size):
+    materials = available_materials()
+    if not materials:
+        raise SystemExit("No material has both a model and a history file.")
+    long_horizon = forecast_cache.max_horizon if not forecast_cache.live else 240
+    return {
+        "single_material": ('GET', '/calculate/', bom(materials[:1], 24, spot=False)),
+        "full_bom": ('GET', '/calculate/', bom(materials, 24)),
+        "long_horizon": ('GET', '/calculate/', bom(materials, long_horizon)),
+        "plot": ('GET', '/plot/', bom(materials, 24)),
+        "batch": ('POST', '/batch/calculate/',
+                  {"boms": [dict(bom(materials, 12 + index % 24), **{materials[0].aliases[0]: 1.0 + index})
+                            for index in range(batch_size)]}),
+    }
+
+
+def vary(payload, index):
+    """A copy of the query `payload` with its first weight changed by `index`, so it misses the response caches."""
+    first = next(iter(payload))
+    return dict(payload, **{first: payload[first] + index})
+
+
+def check_batch(client, materials):
+    """Check that each line of a batch equals the /calculate/ answer for its BOM priced alone."""
+    boms = [bom([material], 3 + index, spot=False) for index, material in enumerate(materials)]
+    boms += [bom(materials[index:], 6, spot=False) for index in range(len(materials))]
+    response = client.post('/batch/calculate/', json={"boms": boms})
+    if response.status_code != 200:
+        raise RuntimeError(f"POST /batch/calculate/ returned {response.status_code}: {response.text[:200]}")
+    for line, payload in zip(response.text.splitlines(), boms):
+        line = json.loads(line)
+        alone = client.get('/calculate/', params=payload).json()
+        if (line['ds'] != [entry['ds'] for entry in alone]
+                or not np.allclose(line['total_product_value'], [entry['total_product_value'] for entry in alone])):
+            raise RuntimeError(f"Batch line {line['index']} differs from /calculate/ for {payload}")
+
+
+def run_scenario(client, method, path, payload, requests, concurrency):
+    def one(index):
+        start = time.perf_counter()
+        if method == 'GET':
+            response = client.get(path, params=vary(payload, index))
+        else:
+            response = client.post(path, json=payload)
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.text[:200]}")
+        return elapsed
+
+    one(requests)  # warm up the forecast cache and lazy imports
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(one, range(requests))))
+    wall = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "p50_seconds": p50,
+        "p95_seconds": p95,
+        "p99_seconds": p99,
+        "mean_seconds": latencies.mean(),
+        "requests_per_second": requests / wall,
+        "peak_rss_bytes": peak_rss(),
+    }
+
+
+def stage_timings(materials, repeat, months=24):
+    """Median seconds per stage of a live forecast of each material, outside of any cache."""
+    import pandas as pd
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    from forecast_cache import DATA_DIR
+    from model_registry import ModelRegistry
+    from utili import product_estimate_price, spot_reference
+
+    stages = {}
+    for material in materials:
+        timings = {"model_load": [], "read_history": [], "future_dataframe": [], "predict": [],
+                   "spot_rescaling": []}
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model = ModelRegistry().get(material.model)
+            timings["model_load"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            history = pd.read_csv(os.path.join(DATA_DIR, material.csv + '.csv'))
+            timings["read_history"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            df_future = model.make_future_dataframe(history, periods=months, n_historic_predictions=True)
+            timings["future_dataframe"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            forecast = model.predict(df_future)[['ds', 'yhat1']]
+            timings["predict"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            # The spot price scales the weight by the ratio to the latest historic forecast
+            100.0 / spot_reference(forecast, months)
+            timings["spot_rescaling"].append(time.perf_counter() - start)
+        stages[material.name] = {stage: float(np.median(values)) for stage, values in timings.items()}
+
+    predictions = product_estimate_price({material.name: 1.0 for material in materials})
+    serialization = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        JSONResponse(jsonable_encoder(predictions)).render(predictions)
+        serialization.append(time.perf_counter() - start)
+    stages["serialization"] = float(np.median(serialization))
+    return stages
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pricing endpoints.")
+    parser.add_argument('--requests', type=int, default=200, help="Timed requests per scenario (default 200)")
+    parser.add_argument('--concurrency', type=int, default=1, help="Concurrent clients (default 1)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="BOMs per batch request (default 1000)")
+    parser.add_argument('--stage-repeat', type=int, default=5, help="Repetitions of the stage breakdown (default 5)")
+    parser.add_argument('--scenarios', nargs='+', help="Run only these scenarios")
+    parser.add_argument('--url', help="Benchmark a running service instead of the in-process app")
+    parser.add_argument('--output', help="Write the results as JSON to this file instead of stdout")
+    args = parser.parse_args()
+    logging.getLogger('NP').setLevel(logging.ERROR)
+
+    if args.url:
+        import httpx
+        client = httpx.Client(base_url=args.url, timeout=600)
+    else:
+        from fastapi.testclient import TestClient
+        import main as service
+        client = TestClient(service.app)
+        client.__enter__()  # runs the startup handlers
+    rss_ready = current_rss()
+
+    check_batch(client, available_materials())
+    results = {}
+    for name, (method, path, payload) in scenarios(args.batch_size).items():
+        if args.scenarios and name not in args.scenarios:
+            continue
+        requests = max(1, args.requests // 10) if name == 'batch' else args.requests
+        results[name] = run_scenario(client, method, path, payload, requests, args.concurrency)
+        if name == 'batch':
+            results[name]["boms_per_second"] = results[name]["requests_per_second"] * args.batch_size
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "target": args.url or "in-process",
+        "forecast_source": forecast_cache.source,
+        "rss_ready_bytes": rss_ready,
+        "scenarios": results,
+    }
+    if not args.url and forecast_cache.source == 'live':
+        report["stages"] = stage_timings(available_materials(), args.stage_repeat)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
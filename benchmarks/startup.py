@@ -0,0 +1,94 @@
+#
+# SPDX-FileName: startup.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Measure how long a fresh worker takes to become ready, and how large it is.
+
+Usage (from the repository root):
+    python benchmarks/startup.py [--repeat 5] [--modes live numpy materialized] [--output startup.json]
+
+Every run starts a new interpreter that imports `main`, runs the startup
+handlers and answers `/status`. Reported per mode are the median import and
+startup time, the resident set size after each step and which heavy libraries
+ended up imported. Numpy mode needs the weights files of `lite_model.py` and
+materialized mode the artifact of `materialize.py`.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['torch', 'neuralprophet', 'pytorch_lightning', 'matplotlib', 'pandas']
+
+CHILD = r'''
+import asyncio, json, resource, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from model_registry import current_rss
+rss_import = current_rss()
+for handler in main.app.router.on_startup:
+    handler()
+asyncio.run(main.read_root())
+ready = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "startup_seconds": ready - imported,
+    "ready_seconds": ready - start,
+    "rss_after_import_bytes": rss_import,
+    "rss_ready_bytes": current_rss(),
+    "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    "modules": {name: name in sys.modules for name in %r},
+}))
+'''
+
+
+def run_once(mode, materialized_dir):
+    env = dict(os.environ, FORECAST_SOURCE=mode, MATERIALIZED_DIR=materialized_dir)
+    completed = subprocess.run([sys.executable, '-c', CHILD % HEAVY_MODULES], cwd=REPOSITORY, env=env,
+                               capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def benchmark(mode, repeat, materialized_dir):
+    runs = [run_once(mode, materialized_dir) for _ in range(repeat)]
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0] if key != 'modules'}
+    result['modules'] = runs[-1]['modules']
+    result['runs'] = repeat
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker import time and RSS per serving mode.")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per mode (default 5)")
+    parser.add_argument('--modes', nargs='+', default=['live', 'numpy', 'materialized'],
+                        choices=['live', 'numpy', 'materialized'])
+    parser.add_argument('--materialized-dir', default='materialized', help="Artifact of materialize.py")
+    parser.add_argument('--output', help="Write the results as JSON to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes:
+        manifest = os.path.join(REPOSITORY, args.materialized_dir, 'manifest.json')
+        if mode == 'materialized' and not os.path.exists(manifest):
+            results[mode] = {"skipped": f"{manifest} does not exist, run materialize.py first"}
+            continue
+        results[mode] = benchmark(mode, args.repeat, args.materialized_dir)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
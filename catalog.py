@@ -0,0 +1,123 @@
+#
+# SPDX-FileName: catalog.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import json
+import os
+from dataclasses import dataclass
+
+CATALOG_PATH = os.environ.get('MATERIAL_CATALOG', 'materials.json')
+DEFAULT_MONTHS = 24
+MONTHS_DESCRIPTION = "Forecasting period in months (default is 24 months if argument not provided)"
+
+
+@dataclass(frozen=True)
+class Material:
+    """
+    One material that can be part of a product.
+
+    Attributes:
+        name (str): Key of the material's weight in the argument dict.
+        label (str): Human readable name.
+        description (str): Description of the weight parameter.
+        unit (str): Unit of the weight.
+        model (str): Name of the model pickle in `models/`.
+        csv (str): Name of the history CSV in `data/`.
+        spot_price (bool): Whether the forecast can be rescaled to a spot price.
+        aliases (tuple): Query parameter names for the weight; the spot price is `p_<alias>`.
+    """
+    name: str
+    label: str
+    description: str
+    unit: str
+    model: str
+    csv: str
+    spot_price: bool = False
+    aliases: tuple = ()
+
+    @property
+    def spot_key(self):
+        return 'p_' + self.name
+
+    @property
+    def spot_description(self):
+        return f"Spot price of {self.label}"
+
+
+class Catalog:
+    """The materials the service can price, in the order their dates label a product forecast."""
+
+    def __init__(self, materials):
+        self.materials = {}
+        # Query parameter name -> (argument key, description)
+        self.query_parameters = {}
+        for material in materials:
+            if material.name in self.materials:
+                raise ValueError(f"Material {material.name} is defined twice.")
+            self.materials[material.name] = material
+        for material in materials:
+            for alias in material.aliases:
+                self._add_parameter(alias, material.name, material.description)
+        for material in materials:
+            if material.spot_price:
+                for alias in material.aliases:
+                    self._add_parameter('p_' + alias, material.spot_key, material.spot_description)
+        self._add_parameter('months', 'months', MONTHS_DESCRIPTION)
+
+    def _add_parameter(self, query_name, argument, description):
+        if query_name in self.query_parameters:
+            raise ValueError(f"Query parameter {query_name} is used by more than one material.")
+        self.query_parameters[query_name] = (argument, description)
+
+    def __iter__(self):
+        return iter(self.materials.values())
+
+    def __contains__(self, name):
+        return name in self.materials
+
+    def __getitem__(self, name):
+        return self.materials[name]
+
+    def spot_material(self, argument):
+        """The material whose spot price is stored under `argument`, or None."""
+        material = self.materials.get(argument[2:]) if argument.startswith('p_') else None
+        return material if material is not None and material.spot_price else None
+
+    def arguments(self, parameters):
+        """
+        Map query parameter names to the argument dict used for pricing, dropping unset values.
+
+        Raises:
+            ValueError: for unknown parameters, or when two aliases of one argument are given.
+        """
+        arguments = {}
+        for query_name, value in parameters.items():
+            if value is None:
+                continue
+            if query_name not in self.query_parameters:
+                raise ValueError(f"Unknown parameter {query_name}.")
+            argument = self.query_parameters[query_name][0]
+            if argument in arguments:
+                raise ValueError(f"{argument} is given more than once.")
+            arguments[argument] = value
+        return arguments
+
+    def help_info(self):
+        return {query_name: description for query_name, (_, description) in self.query_parameters.items()}
+
+
+def load_catalog(path=CATALOG_PATH):
+    """Read the material catalog from a JSON file."""
+    with open(path) as f:
+        entries = json.load(f)['materials']
+    materials = []
+    for entry in entries:
+        entry = dict(entry)
+        entry['aliases'] = tuple(entry.get('aliases') or (entry['name'],))
+        materials.append(Material(**entry))
+    return Catalog(materials)
+
+
+catalog = load_catalog()
@@ -0,0 +1,243 @@
+#
+# SPDX-FileName: etl.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Build the monthly `ds,y` series in `data/` from the raw source files.
+
+Usage:
+    python etl.py [name ...] [--sources sources.json] [--output data] [--workers 4] [--force]
+
+Every entry of `sources.json` names a raw file, its format and how to clean
+it. The sources are parsed on a pool of processes and written as CSV files
+sorted by month, each replaced atomically. The SHA-256 of every source file
+and of its entry are kept in `<output>/.etl-state.json`, and sources whose
+file, entry and output are unchanged since the last run are skipped. Months
+that were added to an output after the ones the ETL wrote, e.g. by `ingest.py`,
+are kept when it is rebuilt.
+
+Formats:
+    fred           FRED download: a DATE column and one value column, "." for missing values
+    indexmundi     IndexMundi price table: a title row, then "Month" (e.g. Nov-03) and "Price"
+    excel          Excel sheet with the columns `date_column` and `value_column` (needs openpyxl)
+    oecd           OECD annual data: "Value" of the country `location`, or else the mean over
+                   the countries reported in every year, leaving out aggregates such as OECD or EA19
+    energy_charts  Energy-Charts monthly export: a units row, then MM.YYYY months and prices
+
+Options of an entry:
+    until          Last month to keep, e.g. the end of the training period
+    fill           "ffill" fills missing values with the previous month's
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from forecast_cache import DATA_DIR
+from materialize import write_atomic
+
+logger = logging.getLogger(__name__)
+
+SOURCES_PATH = os.environ.get('ETL_SOURCES', 'sources.json')
+STATE_NAME = '.etl-state.json'
+
+
+def parse_fred(path, entry):
+    frame = pd.read_csv(path, na_values=['.'])
+    return pd.DataFrame({'ds': pd.to_datetime(frame.iloc[:, 0]), 'y': pd.to_numeric(frame.iloc[:, 1], errors='coerce')})
+
+
+def parse_indexmundi(path, entry):
+    frame = pd.read_csv(path, skiprows=1, encoding='utf-8-sig')
+    return pd.DataFrame({'ds': pd.to_datetime(frame['Month'], format='%b-%y'),
+                         'y': pd.to_numeric(frame['Price'].astype(str).str.replace(',', ''), errors='coerce')})
+
+
+def parse_excel(path, entry):
+    frame = pd.read_excel(path, sheet_name=entry.get('sheet', 0))
+    return pd.DataFrame({'ds': pd.to_datetime(frame[entry['date_column']]),
+                         'y': pd.to_numeric(frame[entry['value_column']], errors='coerce')})
+
+
+def parse_oecd(path, entry):
+    frame = pd.read_csv(path, encoding='utf-8-sig')
+    if entry.get('location'):
+        frame = frame[frame['LOCATION'] == entry['location']]
+    else:
+        # Aggregates are not three-letter country codes; countries missing a year would shift the mean
+        frame = frame[frame['LOCATION'].str.fullmatch('[A-Z]{3}')]
+        years = frame.groupby('LOCATION')['TIME'].nunique()
+        frame = frame[frame['LOCATION'].isin(years.index[years == frame['TIME'].nunique()])]
+    yearly = frame.groupby('TIME')['Value'].mean()
+    yearly.index = pd.to_datetime(yearly.index.astype(str), format='%Y')
+    # Every month of a year takes the annual value
+    months = pd.date_range(yearly.index.min(), yearly.index.max() + pd.DateOffset(months=11), freq='MS')
+    monthly = yearly.reindex(months, method='ffill')
+    return pd.DataFrame({'ds': monthly.index, 'y': monthly.to_numpy()})
+
+
+def parse_energy_charts(path, entry):
+    frame = pd.read_csv(path, skiprows=[1], encoding='utf-8-sig', dtype={'Month': str})
+    month = frame['Month'].str.split('.', expand=True)
+    # Months are exported as numbers, so a year ending in zero loses it (10.2020 becomes 10.202)
+    ds = month[1].str.ljust(4, '0') + '-' + month[0].str.zfill(2)
+    return pd.DataFrame({'ds': pd.to_datetime(ds, format='%Y-%m'), 'y': pd.to_numeric(frame.iloc[:, 1], errors='coerce')})
+
+
+PARSERS = {
+    'fred': parse_fred,
+    'indexmundi': parse_indexmundi,
+    'excel': parse_excel,
+    'oecd': parse_oecd,
+    'energy_charts': parse_energy_charts,
+}
+
+
+def normalize(series, entry):
+    """Sort by month, keep the last value of a month given twice and apply the entry's cleaning options."""
+    series = series.dropna(subset=['ds']).copy()
+    series['ds'] = series['ds'].dt.to_period('M').dt.to_timestamp()
+    series = series.drop_duplicates(subset='ds', keep='last').sort_values('ds')
+    if entry.get('until'):
+        series = series[series['ds'] <= pd.Timestamp(entry['until'])]
+    if entry.get('fill') == 'ffill':
+        series['y'] = series['y'].ffill()
+    return series.reset_index(drop=True)
+
+
+def process(entry):
+    """Parse and normalize one source; returns the CSV contents of its series."""
+    series = normalize(PARSERS[entry['format']](entry['path'], entry), entry)
+    return series.to_csv(index=False, date_format='%Y-%m-%d').encode()
+
+
+def keep_newer(contents, output_path, written_until=None):
+    """
+    `contents` followed by the months of the existing file at `output_path` that
+    are later than both its last month and `written_until`, the last month the
+    ETL wrote there before.
+
+    Returns:
+        tuple: The merged CSV contents, the last month of `contents` and the number of months kept.
+    """
+    series = pd.read_csv(io.BytesIO(contents), parse_dates=['ds'])
+    last = series['ds'].max()
+    if not os.path.exists(output_path):
+        return contents, last, 0
+    existing = pd.read_csv(output_path, parse_dates=['ds'])
+    newer = existing.loc[existing['ds'] > max(last, pd.Timestamp(written_until or last)), ['ds', 'y']]
+    if newer.empty:
+        return contents, last, 0
+    merged = pd.concat([series, newer], ignore_index=True)
+    return merged.to_csv(index=False, date_format='%Y-%m-%d').encode(), last, len(newer)
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_sources(path=SOURCES_PATH):
+    with open(path) as f:
+        sources = json.load(f)['sources']
+    for entry in sources:
+        if entry['format'] not in PARSERS:
+            raise ValueError(f"{entry['name']}: unknown format {entry['format']}.")
+    return sources
+
+
+def read_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def run(sources, output_dir=DATA_DIR, workers=None, force=False):
+    """
+    Rebuild the series of `sources` whose source file, entry or output changed.
+
+    Returns:
+        dict: Name of every source to "written", "unchanged" or the error it failed with.
+    """
+    state = read_state(output_dir)
+    results = {}
+    pending = {}
+    for entry in sources:
+        output_path = os.path.join(output_dir, entry['name'] + '.csv')
+        fingerprint = {'source': file_sha256(entry['path']), 'entry': sha256(json.dumps(entry, sort_keys=True).encode())}
+        previous = state.get(entry['name'], {})
+        if (not force and os.path.exists(output_path)
+                and {key: previous.get(key) for key in fingerprint} == fingerprint
+                and previous.get('output') == file_sha256(output_path)):
+            results[entry['name']] = 'unchanged'
+        else:
+            pending[entry['name']] = entry, output_path, fingerprint, previous.get('written_until')
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers or min(len(pending), os.cpu_count() or 1)) as pool:
+            futures = {pool.submit(process, entry): name for name, (entry, _, _, _) in pending.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                _, output_path, fingerprint, written_until = pending[name]
+                try:
+                    contents = future.result()
+                except Exception as e:
+                    logger.error("%s: %s", name, e)
+                    results[name] = f"failed: {e}"
+                    continue
+                # Months added after the source's, e.g. by ingest.py, must not be dropped
+                contents, last, kept = keep_newer(contents, output_path, written_until)
+                results[name] = 'written'
+                if kept:
+                    logger.warning("%s: kept %d months of %s that are newer than the source", name, kept, output_path)
+                    results[name] = f"written, kept {kept} newer months"
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                write_atomic(output_path, lambda f: f.write(contents))
+                state[name] = dict(fingerprint, output=sha256(contents), written_until=last.strftime('%Y-%m-%d'))
+                logger.info("%s: written to %s", name, output_path)
+        write_atomic(os.path.join(output_dir, STATE_NAME),
+                     lambda f: f.write((json.dumps(state, indent=2, sort_keys=True) + '\n').encode()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the monthly series in data/ from the raw sources.")
+    parser.add_argument('names', nargs='*', help="Sources to build (default: all)")
+    parser.add_argument('--sources', default=SOURCES_PATH, help="Source catalog (default sources.json)")
+    parser.add_argument('--output', default=DATA_DIR, help="Output directory (default data)")
+    parser.add_argument('--workers', type=int, help="Parsing processes (default: one per core)")
+    parser.add_argument('--force', action='store_true', help="Rebuild every source, even when unchanged")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    sources = load_sources(args.sources)
+    unknown = set(args.names) - {entry['name'] for entry in sources}
+    if unknown:
+        raise SystemExit(f"Unknown sources: {', '.join(sorted(unknown))}")
+    results = run([entry for entry in sources if not args.names or entry['name'] in args.names],
+                  args.output, args.workers, args.force)
+    for name, result in results.items():
+        print(f"{name}: {result}")
+    if any(result.startswith('failed') for result in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+#
+# SPDX-FileName: forecast_cache.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from lite_model import LiteModel, weights_path
+from metrics import stage
+from model_registry import MODELS_DIR, registry
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = 'data'
+# Longest horizon (in months) that is precomputed; longer requests run the model directly
+MAX_HORIZON = int(os.environ.get('FORECAST_MAX_HORIZON', 120))
+# 'live' runs the models in models/, 'numpy' evaluates their weights files exported by lite_model.py,
+# 'materialized' serves the artifact written by materialize.py
+FORECAST_SOURCE = os.environ.get('FORECAST_SOURCE', 'live')
+MATERIALIZED_DIR = os.environ.get('MATERIALIZED_DIR', 'materialized')
+MANIFEST_NAME = 'manifest.json'
+# Threads that run forecasts of different models concurrently
+FORECAST_WORKERS = int(os.environ.get('FORECAST_WORKERS', min(4, os.cpu_count() or 1)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """
+    The process-wide forecast thread pool.
+
+    It is created on first use, so every uvicorn worker process gets its own
+    pool after it started rather than inheriting one across a fork.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FORECAST_WORKERS, thread_name_prefix='forecast')
+        return _executor
+
+
+def run_forecast(prophet_model, data_file, forecasting_period, model_name=''):
+    """Run a NeuralProphet model over its history plus `forecasting_period` future months."""
+    with stage('future_dataframe', model_name):
+        df_future = prophet_model.make_future_dataframe(data_file, periods=forecasting_period, n_historic_predictions=True)
+    with stage('predict', model_name):
+        forecast = prophet_model.predict(df_future)
+    return forecast[['ds', 'yhat1']]
+
+
+class Forecast:
+    """
+    The projected series of one model: the historic predictions followed by
+    `horizon` future months.
+    """
+
+    def __init__(self, frame, horizon, signature):
+        self.frame = frame
+        self.horizon = horizon
+        self.history_length = len(frame) - horizon
+        self.signature = signature
+        self.computed_at = time.time()
+
+    def projection(self, forecasting_period):
+        """
+        Return `(predicted, full)` like a direct forecast for `forecasting_period`
+        months would: the future months only, and history plus future months.
+        Both are copies, so callers may modify them.
+        """
+        full = self.frame.iloc[:self.history_length + forecasting_period].copy()
+        return full.tail(forecasting_period).copy(), full
+
+
+class ForecastCache:
+    """
+    Per-(model, CSV) forecasts computed once up to `max_horizon` months.
+
+    The forecast of a model does not depend on a caller's weights or spot prices,
+    so every request horizon up to `max_horizon` is served by slicing the cached
+    series. An entry is recomputed when the model pickle or the history CSV
+    changes on disk.
+    """
+
+    # Whether forecasts past `max_horizon` can be computed on demand
+    live = True
+    source = 'live'
+
+    def __init__(self, model_registry=registry, data_dir=DATA_DIR, max_horizon=MAX_HORIZON):
+        self.model_registry = model_registry
+        self.data_dir = data_dir
+        self.max_horizon = max_horizon
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def csv_path(self, csv_file_name):
+        return os.path.join(self.data_dir, csv_file_name + '.csv')
+
+    def available(self, model_name, csv_file_name):
+        return os.path.exists(self.model_registry.path(model_name)) and os.path.exists(self.csv_path(csv_file_name))
+
+    def warm(self, materials):
+        """Compute the forecasts of all `materials` that have a model; failures are logged, not raised."""
+        futures = {material.name: executor().submit(self.get, material.model, material.csv)
+                   for material in materials if self.available(material.model, material.csv)}
+        for name, future in futures.items():
+            try:
+                future.result()
+            except Exception:
+                logger.exception("Could not compute the forecast of %s", name)
+
+    def signature(self, model_name, csv_file_name):
+        stat = os.stat(self.csv_path(csv_file_name))
+        return self.model_registry.signature(model_name), (stat.st_mtime_ns, stat.st_size)
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _compute(self, model_name, csv_file_name, forecasting_period):
+        import pandas as pd
+
+        prophet_model = self.model_registry.get(model_name)
+        with stage('read_history', model_name):
+            data_file = pd.read_csv(self.csv_path(csv_file_name))
+        with self.model_registry.lock(model_name):
+            return run_forecast(prophet_model, data_file, forecasting_period, model_name)
+
+    def is_cached(self, model_name, csv_file_name, forecasting_period):
+        """Whether `forecasting_period` months can be served from an up-to-date cache entry."""
+        entry = self._entries.get((model_name, csv_file_name))
+        return (forecasting_period <= self.max_horizon and entry is not None
+                and entry.signature == self.signature(model_name, csv_file_name))
+
+    def get(self, model_name, csv_file_name):
+        """Return the cached `Forecast` for a model, computing it if missing or stale."""
+        key = (model_name, csv_file_name)
+        signature = self.signature(model_name, csv_file_name)
+        entry = self._entries.get(key)
+        if entry is not None and entry.signature == signature:
+            self.hits += 1
+            return entry
+
+        # Concurrent misses for the same model wait for a single computation
+        with self._lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and entry.signature == signature:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            start = time.perf_counter()
+            frame = self._compute(model_name, csv_file_name, self.max_horizon)
+            entry = Forecast(frame.reset_index(drop=True), self.max_horizon, signature)
+            self._entries[key] = entry
+            logger.info("Cached %d-month forecast of %s in %.3fs", self.max_horizon, model_name,
+                        time.perf_counter() - start)
+        return entry
+
+    def projection(self, model_name, csv_file_name, forecasting_period):
+        """`(predicted, full)` for `forecasting_period` months, sliced from the cache when possible."""
+        if forecasting_period > self.max_horizon:
+            with self._lock((model_name, csv_file_name)):
+                forecast = self._compute(model_name, csv_file_name, forecasting_period)
+            return forecast.tail(forecasting_period), forecast
+        return self.get(model_name, csv_file_name).projection(forecasting_period)
+
+    def _timed_projection(self, model_name, csv_file_name, forecasting_period):
+        with stage('projection', model_name):
+            return self.projection(model_name, csv_file_name, forecasting_period)
+
+    def projections(self, models, forecasting_period):
+        """
+        `projection` for several `(model_name, csv_file_name)` pairs, in order.
+
+        Cached forecasts are sliced right away; the others are computed
+        concurrently on the forecast thread pool, so a request waits for its
+        slowest model rather than the sum of all of them.
+        """
+        results = [None] * len(models)
+        missing = []
+        for index, (model_name, csv_file_name) in enumerate(models):
+            if self.is_cached(model_name, csv_file_name, forecasting_period):
+                with stage('projection', model_name):
+                    results[index] = self.projection(model_name, csv_file_name, forecasting_period)
+            else:
+                missing.append(index)
+
+        if len(missing) == 1:
+            results[missing[0]] = self._timed_projection(*models[missing[0]], forecasting_period)
+        elif missing:
+            futures = {index: executor().submit(self._timed_projection, *models[index], forecasting_period)
+                       for index in missing}
+            for index, future in futures.items():
+                results[index] = future.result()
+        return results
+
+    def stats(self):
+        return {
+            "source": self.source,
+            "max_horizon": self.max_horizon,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": [{"model": model_name, "csv": csv_file_name, "computed_at": entry.computed_at}
+                        for (model_name, csv_file_name), entry in sorted(self._entries.items())],
+        }
+
+
+class MaterializedForecastCache(ForecastCache):
+    """
+    Forecasts served from the artifact written by `materialize.py`.
+
+    The forecast values are memory-mapped and no model is ever loaded, so
+    neither neuralprophet nor torch is imported. Horizons are limited to the one
+    the artifact was written with. A new artifact is picked up as soon as its
+    manifest is replaced.
+    """
+
+    live = False
+    source = 'materialized'
+
+    def __init__(self, path=MATERIALIZED_DIR):
+        super().__init__(model_registry=None, max_horizon=0)
+        self.path = path
+        self._store = None
+        self._store_lock = threading.Lock()
+
+    def _refresh(self):
+        """Return `(signature, series, values)` of the current artifact, reloading it if it was replaced."""
+        stat = os.stat(os.path.join(self.path, MANIFEST_NAME))
+        signature = stat.st_mtime_ns, stat.st_size
+        store = self._store
+        if store is not None and store[0] == signature:
+            return store
+        with self._store_lock:
+            if self._store is None or self._store[0] != signature:
+                with open(os.path.join(self.path, MANIFEST_NAME)) as f:
+                    manifest = json.load(f)
+                values = np.load(os.path.join(self.path, manifest['values']), mmap_mode='r')
+                series = {(entry['model'], entry['csv']): entry for entry in manifest['series']}
+                self.max_horizon = manifest['horizon']
+                self._store = signature, series, values
+                logger.info("Loaded %d materialized forecasts from %s", len(series), self.path)
+            return self._store
+
+    def available(self, model_name, csv_file_name):
+        return (model_name, csv_file_name) in self._refresh()[1]
+
+    def signature(self, model_name, csv_file_name):
+        return self._refresh()[0]
+
+    def _compute(self, model_name, csv_file_name, forecasting_period):
+        import pandas as pd
+
+        _, series, values = self._refresh()
+        entry = series[(model_name, csv_file_name)]
+        if forecasting_period > entry['horizon']:
+            raise ValueError(f"{model_name} is materialized for {entry['horizon']} months only.")
+        records = values[entry['offset']:entry['offset'] + entry['history_length'] + forecasting_period]
+        with stage('read_materialized', model_name):
+            return pd.DataFrame({'ds': records['ds'].astype('datetime64[ns]'), 'yhat1': records['yhat1']})
+
+    def stats(self):
+        stats = super().stats()
+        stats["path"] = self.path
+        return stats
+
+
+class NumpyForecastCache(ForecastCache):
+    """
+    Forecasts evaluated with NumPy from the weights files exported by `lite_model.py`.
+
+    Neither neuralprophet nor torch is imported, and a forecast of any horizon
+    takes well under a millisecond, so horizons past `max_horizon` are computed
+    on demand like in live mode. A weights file is reloaded when it is replaced.
+    """
+
+    source = 'numpy'
+
+    def __init__(self, models_dir=MODELS_DIR, data_dir=DATA_DIR, max_horizon=MAX_HORIZON):
+        super().__init__(model_registry=None, data_dir=data_dir, max_horizon=max_horizon)
+        self.models_dir = models_dir
+        self._models = {}
+
+    def available(self, model_name, csv_file_name):
+        return os.path.exists(weights_path(self.models_dir, model_name)) and os.path.exists(self.csv_path(csv_file_name))
+
+    def signature(self, model_name, csv_file_name):
+        weights = os.stat(weights_path(self.models_dir, model_name))
+        history = os.stat(self.csv_path(csv_file_name))
+        return (weights.st_mtime_ns, weights.st_size), (history.st_mtime_ns, history.st_size)
+
+    def _model(self, model_name):
+        path = weights_path(self.models_dir, model_name)
+        stat = os.stat(path)
+        signature = stat.st_mtime_ns, stat.st_size
+        loaded = self._models.get(model_name)
+        if loaded is None or loaded[0] != signature:
+            loaded = self._models[model_name] = signature, LiteModel.load(path)
+        return loaded[1]
+
+    def _compute(self, model_name, csv_file_name, forecasting_period):
+        import pandas as pd
+
+        lite_model = self._model(model_name)
+        with stage('read_history', model_name):
+            history = pd.read_csv(self.csv_path(csv_file_name), parse_dates=['ds'])
+        with stage('predict', model_name):
+            ds, yhat1 = lite_model.forecast(history['ds'].to_numpy(), forecasting_period)
+        return pd.DataFrame({'ds': ds, 'yhat1': yhat1})
+
+
+forecast_cache = {
+    'materialized': MaterializedForecastCache,
+    'numpy': NumpyForecastCache,
+}.get(FORECAST_SOURCE, ForecastCache)()
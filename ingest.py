@@ -0,0 +1,144 @@
+#
+# SPDX-FileName: ingest.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Append new monthly prices of one material and refresh only its model.
+
+Usage:
+    python ingest.py <material> <observations.csv> [--epochs 30] [--learning-rate 0.01]
+
+`observations.csv` has the columns `ds,y` like the files in `data/`. The new
+months are merged into the material's history, and the existing model is
+trained further on the extended history, starting from its current weights.
+The refreshed model and history are then published with atomic renames; a
+running service reloads both on its next request. When a materialized
+artifact exists, the material's series in it is refreshed as well.
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from catalog import catalog
+from forecast_cache import DATA_DIR, MANIFEST_NAME, MATERIALIZED_DIR
+from lite_model import export, weights_path
+from materialize import materialize, write_atomic
+from model_registry import MODELS_DIR, registry
+
+logger = logging.getLogger(__name__)
+
+
+def merge_observations(history, observations):
+    """
+    Merge new `ds,y` observations into a history, sorted by month.
+
+    Observations replace history rows of the same month.
+
+    Raises:
+        ValueError: if an observation is not dated on the first day of a month.
+    """
+    observations = observations[['ds', 'y']].copy()
+    observations['ds'] = pd.to_datetime(observations['ds'])
+    if not observations['ds'].dt.is_month_start.all():
+        raise ValueError("Observations must be dated on the first day of a month.")
+    history = history[['ds', 'y']].copy()
+    history['ds'] = pd.to_datetime(history['ds'])
+    merged = pd.concat([history, observations]).drop_duplicates(subset='ds', keep='last')
+    return merged.sort_values('ds').reset_index(drop=True)
+
+
+def refit(model_path, history, epochs, learning_rate):
+    """
+    Train a copy of the model in `model_path` further on `history`.
+
+    NeuralProphet 0.7 cannot continue training a fitted model, and `fit` always
+    builds a new network. The copy is therefore made to hand its existing
+    network to `fit`, so training starts from the current weights instead of a
+    random initialization. A fixed learning rate skips the learning rate search.
+    """
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    network = model.model
+    # Changepoints are stored in normalized time once fitted; fit would read them as dates
+    changepoints = model.config_trend.changepoints
+    model.config_trend.changepoints = None
+    model.fitted = False
+    model._init_model = lambda: network
+    try:
+        model.fit(history, freq='MS', epochs=epochs, learning_rate=learning_rate, minimal=True)
+    finally:
+        del model._init_model
+        model.config_trend.changepoints = changepoints
+    return model
+
+
+def ingest(material_name, observations, epochs=30, learning_rate=0.01, materialized_dir=MATERIALIZED_DIR):
+    """
+    Merge `observations` into the history of `material_name`, refit its model and publish both.
+
+    Returns:
+        int: Number of history months that were added or changed.
+    """
+    material = catalog[material_name]
+    csv_path = os.path.join(DATA_DIR, material.csv + '.csv')
+    history = pd.read_csv(csv_path, parse_dates=['ds'])
+    merged = merge_observations(history, observations)
+    compared = merged.merge(history[['ds', 'y']], how='left', on=['ds', 'y'], indicator=True)
+    changed = int((compared['_merge'] == 'left_only').sum())
+    if not changed:
+        logger.info("%s: no new observations", material.name)
+        return 0
+
+    start = time.perf_counter()
+    model = refit(registry.path(material.model), merged, epochs, learning_rate)
+    logger.info("%s: refitted on %d months in %.1fs", material.name, len(merged), time.perf_counter() - start)
+
+    # Model first, then history: a service that picks up only one of them recomputes once the other lands
+    write_atomic(registry.path(material.model), lambda f: pickle.dump(model, f))
+    try:
+        weights = export(model)
+    except ValueError as e:
+        logger.warning("%s: no NumPy weights exported: %s", material.name, e)
+    else:
+        write_atomic(weights_path(MODELS_DIR, material.model), lambda f: np.savez(f, **weights))
+    write_atomic(csv_path, lambda f: f.write(merged.to_csv(index=False, date_format='%Y-%m-%d').encode()))
+
+    manifest_path = os.path.join(materialized_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        # Keep the horizon the artifact was built with, so longer requests keep being served
+        with open(manifest_path) as f:
+            horizon = json.load(f)['horizon']
+        materialize(materialized_dir, horizon=horizon, materials=[material])
+    logger.info("%s: published, last observation %s", material.name, merged['ds'].iloc[-1].strftime('%Y-%m'))
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append monthly prices of a material and refresh its model.")
+    # Only a material with a model and a history can be refreshed
+    parser.add_argument('material', choices=[material.name for material in catalog
+                                             if os.path.exists(registry.path(material.model))
+                                             and os.path.exists(os.path.join(DATA_DIR, material.csv + '.csv'))])
+    parser.add_argument('observations', help="CSV file with ds,y columns")
+    parser.add_argument('--epochs', type=int, default=30, help="Training epochs on the extended history (default 30)")
+    parser.add_argument('--learning-rate', type=float, default=0.01, help="Learning rate (default 0.01)")
+    parser.add_argument('--materialized-dir', default=MATERIALIZED_DIR,
+                        help="Artifact of materialize.py to refresh, if it exists (default materialized)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    changed = ingest(args.material, pd.read_csv(args.observations), args.epochs, args.learning_rate,
+                     args.materialized_dir)
+    print(f"{args.material}: {changed} months added or changed")
+
+
+if __name__ == '__main__':
+    main()
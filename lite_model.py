@@ -0,0 +1,188 @@
+#
+# SPDX-FileName: lite_model.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Export fitted NeuralProphet models to small weights files and evaluate them with NumPy.
+
+Usage:
+    python lite_model.py [model ...]
+
+Every pickle in `models/` (or only the named ones) is exported to
+`models/<name>.npz`. A model is the sum of a piecewise linear trend and
+additive Fourier seasonalities in normalized units, so `yhat1` only needs the
+trend and seasonality parameters and the normalization of `ds` and `y`.
+`LiteModel` evaluates them without neuralprophet or torch. Models with
+autoregression, regressors, events, multiplicative seasonality, local trends
+or a frequency other than monthly are not supported and are refused by the
+exporter.
+"""
+
+import argparse
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_SUFFIX = '.npz'
+EPOCH = np.datetime64('1970-01-01', 'ns')
+
+
+def export(model):
+    """
+    Trend, seasonality and normalization parameters of a fitted NeuralProphet model.
+
+    Returns:
+        dict: Arrays to be stored with `np.savez`.
+
+    Raises:
+        ValueError: if the model uses a component the NumPy evaluator does not implement.
+    """
+    unsupported = [name for name, used in [
+        ("autoregression", model.config_ar is not None and model.config_ar.n_lags > 0),
+        ("lagged regressors", bool(model.config_lagged_regressors)),
+        ("future regressors", bool(model.config_regressors)),
+        ("events", bool(model.config_events) or bool(model.config_country_holidays)),
+        ("non-linear trend", model.config_trend.growth != 'linear'),
+        ("regularized trend", model.config_trend.trend_reg != 0),
+        ("local trend", model.config_trend.trend_global_local != 'global'),
+        ("local normalization", not model.config_normalization.global_normalization),
+        ("multiple forecasts", model.n_forecasts != 1),
+        # `LiteModel.forecast` continues the history month by month
+        ("non-monthly frequency", model.data_freq != 'MS'),
+    ] if used]
+    seasonality = model.config_seasonality
+    if seasonality is not None:
+        if seasonality.mode != 'additive' or seasonality.computation != 'fourier':
+            unsupported.append("non-additive or non-Fourier seasonality")
+        if seasonality.global_local != 'global' or any(period.condition_name for period in seasonality.periods.values()):
+            unsupported.append("local or conditional seasonality")
+    if unsupported:
+        raise ValueError(f"Unsupported model components: {', '.join(unsupported)}.")
+
+    network = model.model
+    trend = network.trend
+    data_params = model.config_normalization.global_data_params
+    periods = seasonality.periods if seasonality is not None else {}
+    weights = {
+        'ds_shift': np.int64(data_params['ds'].shift.value),
+        'ds_scale': np.int64(data_params['ds'].scale.value),
+        'y_shift': np.float64(data_params['y'].shift),
+        'y_scale': np.float64(data_params['y'].scale),
+        'trend_bias': trend.bias.detach().numpy().reshape(-1)[0].astype(np.float64),
+        'trend_k0': trend.trend_k0.detach().numpy().reshape(-1)[0].astype(np.float64),
+        'trend_deltas': trend.trend_deltas.detach().numpy()[0, 0].astype(np.float64),
+        'changepoints': trend.trend_changepoints_t.detach().numpy().astype(np.float64),
+        'seasonalities': np.array(list(periods), dtype=np.str_),
+        'periods': np.array([period.period for period in periods.values()], dtype=np.float64),
+    }
+    for name in periods:
+        weights['season_' + name] = network.seasonality.season_params[name].detach().numpy()[0, 0].astype(np.float64)
+    return weights
+
+
+class LiteModel:
+    """NumPy evaluation of an exported model, reproducing the `yhat1` of NeuralProphet's predict."""
+
+    def __init__(self, weights):
+        self.ds_shift = np.datetime64(int(weights['ds_shift']), 'ns')
+        self.ds_scale = float(weights['ds_scale'])
+        self.y_shift = float(weights['y_shift'])
+        self.y_scale = float(weights['y_scale'])
+        self.bias = float(weights['trend_bias'])
+        self.k0 = float(weights['trend_k0'])
+        self.deltas = np.asarray(weights['trend_deltas'])
+        self.changepoints = np.asarray(weights['changepoints'])
+        self.seasonalities = [(float(period), np.asarray(weights['season_' + str(name)]))
+                              for name, period in zip(weights['seasonalities'], weights['periods'])]
+        # Offsets that keep the trend continuous at every changepoint
+        slope_changes = self.deltas - np.concatenate(([self.k0], self.deltas[:-1]))
+        self.gammas = -self.changepoints[1:] * slope_changes[1:]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as weights:
+            return cls(weights)
+
+    def predict(self, ds):
+        """
+        `yhat1` for the dates `ds`.
+
+        Args:
+            ds (array-like): Dates, convertible to `datetime64[ns]`.
+
+        Returns:
+            numpy.ndarray: Forecast prices, float64.
+        """
+        ds = np.asarray(ds, dtype='datetime64[ns]')
+        t = (ds - self.ds_shift).astype(np.int64) / self.ds_scale
+
+        past_changepoint = t[:, None] >= self.changepoints[1:]
+        segment = past_changepoint.sum(axis=1)
+        trend = self.bias + (self.k0 + self.deltas[segment]) * t + past_changepoint @ self.gammas
+
+        # Like NeuralProphet, days since the epoch are single precision
+        days = ((ds - EPOCH).astype(np.int64) // 10**9).astype(np.float32) / np.float32(86400)
+        seasonal = np.zeros(len(ds))
+        for period, params in self.seasonalities:
+            orders = np.arange(1, len(params) // 2 + 1)
+            angles = (2.0 * np.pi * days[:, None] * orders / period).astype(np.float32)
+            # Features alternate sin and cos per order
+            seasonal += np.sin(angles) @ params[0::2] + np.cos(angles) @ params[1::2]
+
+        return (trend + seasonal) * self.y_scale + self.y_shift
+
+    def forecast(self, history_ds, periods):
+        """
+        Dates and `yhat1` of the history followed by `periods` months, like NeuralProphet's
+        `make_future_dataframe(..., n_historic_predictions=True)` and `predict`.
+        """
+        history_ds = np.asarray(history_ds, dtype='datetime64[ns]')
+        last = history_ds.max().astype('datetime64[M]')
+        future = (last + np.arange(1, periods + 1)).astype('datetime64[ns]')
+        ds = np.concatenate([history_ds, future])
+        return ds, self.predict(ds)
+
+
+def weights_path(models_dir, name):
+    return os.path.join(models_dir, name + WEIGHTS_SUFFIX)
+
+
+def export_file(model_path, output_path):
+    """Export the pickled model in `model_path` to `output_path`, replacing it atomically."""
+    import pickle
+
+    from materialize import write_atomic
+
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    weights = export(model)
+    write_atomic(output_path, lambda f: np.savez(f, **weights))
+    return weights
+
+
+def main():
+    from model_registry import MODELS_DIR, ModelRegistry
+
+    parser = argparse.ArgumentParser(description="Export NeuralProphet models to NumPy weights files.")
+    parser.add_argument('models', nargs='*', help="Model names (default: all pickles in the models directory)")
+    parser.add_argument('--models-dir', default=MODELS_DIR, help="Directory of the pickles (default models)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    registry = ModelRegistry(args.models_dir)
+    for name in args.models or registry.available():
+        try:
+            export_file(registry.path(name), weights_path(args.models_dir, name))
+        except ValueError as e:
+            logger.error("%s: %s", name, e)
+            continue
+        logger.info("Exported %s to %s", name, weights_path(args.models_dir, name))
+
+
+if __name__ == '__main__':
+    main()
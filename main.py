@@ -5,201 +5,249 @@
 #
 #
 
-#from typing import Union
-
-from fastapi import FastAPI, Query, HTTPException
-
-from utili import load_model, porphet_predict, convert_json, product_estimate_price, validate_arguments, plot_predictions
+import inspect
+import json
+import time
+from typing import Dict, List, Optional, Union
+
+from fastapi import Depends, FastAPI, Header, Query, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from catalog import DEFAULT_MONTHS, catalog
+from forecast_cache import forecast_cache
+from metrics import metrics, request_seconds, requests_in_flight
+from model_registry import current_rss, registry
+from rendering import chart_cache
+from result_cache import RESULT_CACHE_SECONDS, etag, not_modified, result_cache
+from scenarios import DEFAULT_SCENARIOS, MAX_SCENARIOS, simulate
+from serving import work_queue
+from sweep import SWEEP_MAX_POINTS, Sweep, price_sweep
+from utili import product_estimate_price, validate_arguments, batch_estimate_price, bom_key, cached_chart, \
+    chart_key, draw_chart, validate_available, validate_spot_prices
 
 description = """
 This API service is used to forecast product price given the contributing materials that form the final product.
 
 You can provide a variable "months" to set the forecasting period
 
-forecast starts from 2/2023, as it is the last timestamp sample in the training set
+forecast starts from the month after the last sample in the training set (2/2023 for the shipped data)
+
+spot prices are taken to be the price in the month of the last sample
 
 ## Details on data
 
-"st37": "Weight of ST37 in KG",
-"p_st37": "Spot price of ST37",
-"p_high_carbon": "Spot price of High Carbon",
-"alu": "Weight of Alu in KG",
-"labour": "Labor hours",
-"high_carbon": "Weight of High Carbon in KG",
-"medium_carbon": "Weight of Medium Carbon in KG",
-"p_medium_carbon": "Spot Price of Medium Carbon",
-"p_nodular_cast_iron": "Spot Price of Nodular Cast Iron",
-"nodular_cast_iron": "Weight of Nodular Cast Iron in KG",
-"grey_cast_iron": "Weight of Grey Cast Iron in KG",
-"p_grey_cast_iron": "Spot Price of Grey Cast Iron",
-"nonalloy_cast": "Weight of Nonalloy Cast in KG",
-"p_nonalloy_cast": "Spot Price of Nonalloy Cast",
-"months": "Forecasting period in months (default is 24 months if argument not provided)"
-
-"""
+""" + "\n".join(f'"{query_name}": "{text}",' for query_name, text in catalog.help_info().items()) + "\n"
 
 app = FastAPI(title="Price forecasting service",
     description=description)
 
+def material_query(**parameters):
+    """Collect the material query parameters of a request into a validated argument dict."""
+    try:
+        materials = catalog.arguments(parameters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    validate_arguments(materials)
+    return materials
+
+# The query parameters are generated from the material catalog
+material_query.__signature__ = inspect.Signature([
+    inspect.Parameter(query_name, inspect.Parameter.KEYWORD_ONLY,
+                      default=Query(None, ge=1, title="length of prediction time", description=text)
+                      if argument == 'months' else Query(None, title=query_name, description=text),
+                      annotation=int if argument == 'months' else float)
+    for query_name, (argument, text) in catalog.query_parameters.items()
+])
+
+def service_metrics():
+    """Cache, model and process metrics, read from their owners when /metrics is scraped."""
+    forecasts = forecast_cache.stats()
+    charts = chart_cache.stats()
+    results = result_cache.stats()
+    models = registry.stats()
+    families = [
+        ('cache_hits_total', 'counter', "Cache lookups answered from memory.",
+         [({"cache": "forecast"}, forecasts["hits"]), ({"cache": "chart"}, charts["hits"]),
+          ({"cache": "result"}, results["hits"])]),
+        ('cache_misses_total', 'counter', "Cache lookups that had to compute their value.",
+         [({"cache": "forecast"}, forecasts["misses"]), ({"cache": "chart"}, charts["misses"]),
+          ({"cache": "result"}, results["misses"])]),
+        ('result_cache_coalesced_total', 'counter', "Requests that waited for an identical request in flight.",
+         [({}, results["coalesced"])]),
+        ('chart_cache_bytes', 'gauge', "Size of the rendered charts in the chart cache.", [({}, charts["bytes"])]),
+        ('process_resident_memory_bytes', 'gauge', "Resident set size of this worker.", [({}, current_rss())]),
+    ]
+    serving = work_queue.stats()
+    if serving["mode"] == 'async':
+        families += [
+            ('serving_queue_depth', 'gauge', "Requests waiting for a worker.", [({}, serving["queue_depth"])]),
+            ('serving_running', 'gauge', "Requests being computed by a worker.", [({}, serving["running"])]),
+            ('serving_rejected_total', 'counter', "Requests answered with 503 instead of being computed.",
+             [({"reason": "queue_full"}, serving["rejected"]), ({"reason": "deadline"}, serving["expired"])]),
+        ]
+    for key, documentation in [('parameter_bytes', "Size of the parameters of a loaded model."),
+                               ('rss_delta_bytes', "Growth of the resident set size while loading a model."),
+                               ('file_bytes', "Size of the pickled model file."),
+                               ('load_seconds', "Time it took to load a model.")]:
+        families.append(('model_' + key, 'gauge', documentation,
+                         [({"model": model["name"]}, model[key]) for model in models]))
+    return families
+
+metrics.add_collector(service_metrics)
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    # Unknown paths share one label so scanners cannot grow the metrics without bound
+    path = request.url.path if any(route.path == request.url.path for route in app.routes) else "other"
+    requests_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        requests_in_flight.dec()
+        request_seconds.observe(time.perf_counter() - start, method=request.method, path=path, status=status)
+
+@app.on_event("startup")
+def warm_models():
+    # Load every model and forecast once up front so no request pays for them. Materialized
+    # forecasts are only memory-mapped, so there is nothing worth doing before the first request.
+    if forecast_cache.source == 'live':
+        registry.load_all()
+    if forecast_cache.live:
+        forecast_cache.warm(catalog)
+
 @app.get("/status")
-def read_root():
-    return {"Status": "Service Running"}
+async def read_root():
+    # Served on the event loop, so health checks are answered while the workers are busy
+    return {"Status": "Service Running", "serving": work_queue.stats()}
 
 @app.get("/help")
 def get_help():
-    help_info = {
-        "st37": "Weight of ST37 in KG",
-        "high_carbon": "Weight of High Carbon in KG",
-        "alu": "Weight of Alu in KG",
-        "nodular_cast_iron": "Weight of Nodular Cast Iron in KG",
-        "copper": "Weight of Copper in KG",
-        "medium_carbon": "Weight of Medium Carbon in KG",
-        "nonalloy_cast": "Weight of Nonalloy Cast in KG",
-        "grey_cast_iron": "Weight of Grey Cast Iron in KG",
-        "p_st37": "Spot price of ST37",
-        "p_high_carbon": "Spot price of High Carbon",
-        "p_medium_carbon": "Spot Price of Medium Carbon",
-        "p_nodular_cast_iron": "Spot Price of Nodular Cast Iron",
-        "p_grey_cast_iron": "Spot Price of Grey Cast Iron",
-        "p_nonalloy_cast": "Spot Price of Nonalloy Cast",
-        "labour": "Labor hours",
-        "months": "Forecasting period in months (default is 24 months if argument not provided)"
-    }
-    return help_info
+    return catalog.help_info()
+
+@app.get("/models")
+def get_models():
+    return {"models": registry.stats(), "forecast_cache": forecast_cache.stats(), "chart_cache": chart_cache.stats(),
+            "result_cache": result_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/calculate/")
-def calculate(
-    st37: float = Query(None, title="ST37", description="Weight of ST37"),
-    copper: float = Query(None, title="Copper", description="Weight of Copper"),
-    p_st37: float = Query(None, title = "spot_ST37", description = "spot price of ST37"),
-    p_high_carbon: float = Query(None, title = "spot_High_Carbon", description = "spot price of High Carbon"),
-    alu: float = Query(None, title="Alu", description="Weight of Alu"),
-    labour: float = Query(None, title="Labour", description="Labor hours"),
-    high_carbon: float = Query(None, title="high_carbon", description="Weight of High Carbon"),
-    medium_carbon: float = Query(None, title="medium_carbon", description="Weight of Medium Carbon"),
-    p_medium_carbon: float = Query(None, title = "Spot_Medium_Carbon", description = "Spot Price of Medium Carbon"),
-    p_nodular_cast_iron: float = Query(None, title = "Spot_Nodular_Iron", description = "Spot Price of Nodular Cast Iron"),
-    nodular_cast_iron: float = Query(None, title="nodular_cast_iron", description="Weight of Nodular Cast Iron"),
-    grey_cast_iron: float = Query(None, title="grey_cast_iron", description="Weight of Grey Cast Iron"),
-    p_grey_cast_iron: float = Query(None, title = "Spot_grey_cast_iron", description = "Spot Price of Grey_Cast_Iron"),
-    nonalloy_cast: float = Query(None, title="nonalloy_cast", description="Weight of Nonalloy Cast"),
-    p_nonalloy_cast: float = Query(None, title = "Spot_nonalloy_cast", description = "Spot Price of Nonalloy Cast"),
-    months: int = Query(None, title = "length of prediction time", description = "Forecasting period in months")
-):
-
-    materials = {}
-    # Check and parse ST37 material
-    if st37 is not None:
-        materials["st37"] = st37
-
-    # Check and parse Copper material
-    if copper is not None:
-        materials["copper"] = copper
-
-    if p_st37 is not None:
-        materials["p_st37"] = p_st37
-    # Check and parse Alu material
-    if alu is not None:
-        materials["alu"] = alu
-
-    # Check and parse labor hours
-    if labour is not None:
-        materials["labour_hours"] = labour
-
-    # check and parse high carbon
-    if high_carbon is not None:
-    	materials["high_carbon"] = high_carbon
-
-    if p_high_carbon is not None:
-        materials["p_high_carbon"] = p_high_carbon
-
-    # check and parse grey cast iron
-    if grey_cast_iron is not None:
-        materials["grey_cast_iron"] = grey_cast_iron
-    if p_grey_cast_iron is not None:
-        materials["p_grey_cast_iron"] = p_grey_cast_iron
-
-    # check and parse nodular cast iron
-    if nodular_cast_iron is not None:
-        materials["nodular_cast_iron"] = nodular_cast_iron
-    if p_nodular_cast_iron is not None:
-        materials["p_nodular_cast_iron"] = p_nodular_cast_iron
-    # check and parse nonalloy cast
-    if nonalloy_cast is not None:
-        materials["nonalloy_cast"] = nonalloy_cast
-    if p_nonalloy_cast is not None:
-        materials["p_nonalloy_cast"] = p_nonalloy_cast
-    # check and parse medium carbon
-    if medium_carbon is not None:
-        materials["medium_carbon"] = medium_carbon
-    if p_medium_carbon is not None:
-        materials["p_medium_carbon"] = p_medium_carbon
-    # check and parse months
-    if months is not None:
-       materials["months"] = months
-    validate_arguments(materials)
-    predictions = product_estimate_price(materials)
-    return predictions
+async def calculate(response: Response, materials: dict = Depends(material_query),
+                    if_none_match: str = Header(None)):
+    # Identical queries share one computation and its result; the entity tag changes with the
+    # BOM and whenever a model or history it is priced from is refreshed
+    key = bom_key(materials)
+    tag = etag(key)
+    headers = {"ETag": tag, "Cache-Control": f"max-age={int(RESULT_CACHE_SECONDS)}"}
+    if not_modified(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return await result_cache.get_async(key, lambda: work_queue.run(product_estimate_price, materials))
 
 @app.get("/plot/")
-def plot(
-    st37: float = Query(None, title="ST37", description="Weight of ST37"),
-    copper: float = Query(None, title="Copper", description="Weight of Copper"),
-    p_st37: float = Query(None, title = "spot_ST37", description = "spot price of ST37"),
-    p_high_carbon: float = Query(None, title = "spot_High_Carbon", description = "spot price of High Carbon"),
-    alu: float = Query(None, title="Alu", description="Weight of Alu"),
-    labour: float = Query(None, title="Labour", description="Labor hours"),
-    high_carbon: float = Query(None, title="high_carbon", description="Weight of High Carbon"),
-    medium_carbon: float = Query(None, title="medium_carbon", description="Weight of Medium Carbon"),
-    p_medium_carbon: float = Query(None, title = "Spot_Medium_Carbon", description = "Spot Price of Medium Carbon"),
-    p_nodular_cast_iron: float = Query(None, title = "Spot_Nodular_Iron", description = "Spot Price of Nodular Cast Iron"),
-    nodular_cast_iron: float = Query(None, title="nodular_cast_iron", description="Weight of Nodular Cast Iron"),
-    grey_cast_iron: float = Query(None, title="grey_cast_iron", description="Weight of Grey Cast Iron"),
-    p_grey_cast_iron: float = Query(None, title = "Spot_grey_cast_iron", description = "Spot Price of Grey_Cast_Iron"),
-    nonalloy_cast: float = Query(None, title="nonalloy_cast", description="Weight of Nonalloy Cast"),
-    p_nonalloy_cast: float = Query(None, title = "Spot_nonalloy_cast", description = "Spot Price of Nonalloy Cast"),
-    months: int = Query(None, title = "length of prediction time", description = "Forecasting period in months")
-):
-    # Get the predicted values
-    materials = {}
-    if st37 is not None:
-        materials["st37"] = st37
-    if copper is not None:
-        materials["copper"] = copper
-    if p_st37 is not None:
-        materials["p_st37"] = p_st37
-    if alu is not None:
-        materials["alu"] = alu
-    if labour is not None:
-        materials["labour_hours"] = labour
-    if high_carbon is not None:
-        materials["high_carbon"] = high_carbon
-    if p_high_carbon is not None:
-        materials["p_high_carbon"] = p_high_carbon
-    if grey_cast_iron is not None:
-        materials["grey_cast_iron"] = grey_cast_iron
-    if p_grey_cast_iron is not None:
-        materials["p_grey_cast_iron"] = p_grey_cast_iron
-    if nodular_cast_iron is not None:
-        materials["nodular_cast_iron"] = nodular_cast_iron
-    if p_nodular_cast_iron is not None:
-        materials["p_nodular_cast_iron"] = p_nodular_cast_iron
-    if nonalloy_cast is not None:
-        materials["nonalloy_cast"] = nonalloy_cast
-    if p_nonalloy_cast is not None:
-        materials["p_nonalloy_cast"] = p_nonalloy_cast
-    if medium_carbon is not None:
-        materials["medium_carbon"] = medium_carbon
-    if p_medium_carbon is not None:
-        materials["p_medium_carbon"] = p_medium_carbon
-    if months is not None:
-       materials["months"] = months
-
-    # Validate the arguments
-    validate_arguments(materials)
-    
-    # Get predictions
-    predictions = product_estimate_price(materials)
-    
-    # Plot the predictions
-    return plot_predictions(predictions)
+async def plot(materials: dict = Depends(material_query),
+               image_format: str = Query('png', alias='format', pattern='^(png|svg|json)$',
+                                         description="png or svg image, or json for the plotted series")):
+    # Cached series and charts are answered right away; only a miss waits for a worker
+    if image_format == 'json':
+        predictions = await result_cache.get_async(bom_key(materials),
+                                                   lambda: work_queue.run(product_estimate_price, materials))
+        return {"ds": [entry['ds'] for entry in predictions],
+                "total_product_value": [entry['total_product_value'] for entry in predictions]}
+
+    key = chart_key(materials, image_format)
+    response = cached_chart(key, image_format)
+    if response is None:
+        response = await work_queue.run(draw_chart, materials, image_format, key)
+    return response
+
+@app.get("/scenarios/")
+async def scenario_bands(materials: dict = Depends(material_query),
+                         scenarios: int = Query(DEFAULT_SCENARIOS, ge=100, le=MAX_SCENARIOS,
+                                                description="Number of simulated price paths"),
+                         seed: int = Query(None, description="Seed of the simulation, for reproducible bands")):
+    try:
+        return await work_queue.run(lambda: simulate(materials, scenarios, seed=seed))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class BatchRequest(BaseModel):
+    boms: List[Dict[str, float]] = Field(..., min_length=1, max_length=10000,
+                                         description="Bills of materials, each using the query parameters of /calculate/")
+
+def batch_arguments(index, bom):
+    try:
+        arguments = catalog.arguments(bom)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"BOM {index}: {e}")
+    if not any(argument in catalog for argument in arguments):
+        raise HTTPException(status_code=400, detail=f"BOM {index}: no material weights were provided.")
+    if 'months' in arguments:
+        if arguments['months'] < 1 or arguments['months'] != int(arguments['months']):
+            raise HTTPException(status_code=400, detail=f"BOM {index}: months must be a positive integer.")
+        arguments['months'] = int(arguments['months'])
+    try:
+        validate_spot_prices(arguments)
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=f"BOM {index}: {e.detail}")
+    return arguments
+
+def price_batch(request):
+    boms = [batch_arguments(index, bom) for index, bom in enumerate(request.boms)]
+    # The files of a material are checked once, however many BOMs use it
+    validate_available([material.name for material in catalog if any(material.name in bom for bom in boms)],
+                       max(bom.get('months', DEFAULT_MONTHS) for bom in boms))
+    return batch_estimate_price(boms)
+
+# BOMs serialized per chunk of the streamed /batch/calculate/ response
+BATCH_CHUNK_BOMS = 100
+
+@app.post("/batch/calculate/")
+async def batch_calculate(request: BatchRequest):
+    dates, totals, horizons = await work_queue.run(price_batch, request)
+
+    # One JSON line per BOM, written in chunks as the response is consumed
+    def chunks():
+        for offset in range(0, len(horizons), BATCH_CHUNK_BOMS):
+            yield "".join(json.dumps({"index": index,
+                                      "ds": dates[index][:horizons[index]],
+                                      "total_product_value": totals[index, :horizons[index]].tolist()}) + "\n"
+                          for index in range(offset, min(offset + BATCH_CHUNK_BOMS, len(horizons))))
+
+    return StreamingResponse(work_queue.iterate(chunks()), media_type="application/x-ndjson")
+
+class SweepRange(BaseModel):
+    start: float
+    stop: float
+    step: Optional[float] = Field(None, gt=0, description="Distance between values, the stop is included when it is on the step")
+    num: Optional[int] = Field(None, ge=1, le=SWEEP_MAX_POINTS, description="Number of evenly spaced values including both ends")
+
+class SweepRequest(BaseModel):
+    parameters: Dict[str, Union[float, List[float], SweepRange]] = Field(
+        ..., description="Values per query parameter of /calculate/: a number, a list or a range")
+
+@app.post("/sweep/")
+async def sweep_calculate(request: SweepRequest):
+    parameters = {name: value.model_dump() if isinstance(value, SweepRange) else value
+                  for name, value in request.parameters.items()}
+    try:
+        sweep = Sweep(parameters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    dates, chunks = await work_queue.run(price_sweep, sweep)
+
+    # A header with the grid axes, then the prices of the grid points in row-major order
+    def lines():
+        yield json.dumps({"parameters": {name: values.tolist() for name, values in sweep.axes.items()},
+                          "shape": sweep.shape, "ds": dates}) + "\n"
+        for offset, totals in chunks:
+            yield json.dumps({"offset": offset, "total_product_value": totals}) + "\n"
+
+    return StreamingResponse(work_queue.iterate(lines()), media_type="application/x-ndjson")
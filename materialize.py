@@ -0,0 +1,139 @@
+#
+# SPDX-FileName: materialize.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Precompute the forecast of every material into one compact artifact.
+
+Usage:
+    python materialize.py [--horizon 120] [--output materialized]
+
+For every material in the catalog whose model and history CSV exist, the model
+is run over its history plus `--horizon` future months. The forecasts are
+concatenated into one `.npy` array of (month, value) records, next to a
+`manifest.json` that records where each series starts and how much of it is
+history. Start the API with `FORECAST_SOURCE=materialized` to serve from the
+artifact without loading any model.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from catalog import catalog
+from forecast_cache import ForecastCache, MANIFEST_NAME, MATERIALIZED_DIR
+from model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+# One record per forecast month; the dtype is what the serving process memory-maps
+RECORD_DTYPE = np.dtype([('ds', 'datetime64[M]'), ('yhat1', 'f8')])
+
+
+def write_atomic(path, write):
+    """Write a file through `write(f)` into a temporary file and move it into place."""
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+
+def series_records(forecast):
+    records = np.empty(len(forecast.frame), dtype=RECORD_DTYPE)
+    records['ds'] = forecast.frame['ds'].to_numpy().astype('datetime64[M]')
+    records['yhat1'] = forecast.frame['yhat1'].to_numpy()
+    return records
+
+
+def read_artifact(output_dir):
+    """Return `{(model, csv): (manifest entry, records)}` of an existing artifact, or {} if there is none."""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    values = np.load(os.path.join(output_dir, manifest['values']))
+    series = {}
+    for index, entry in enumerate(manifest['series']):
+        end = manifest['series'][index + 1]['offset'] if index + 1 < len(manifest['series']) else len(values)
+        series[(entry['model'], entry['csv'])] = entry, values[entry['offset']:end]
+    return series
+
+
+def materialize(output_dir=MATERIALIZED_DIR, horizon=120, materials=None):
+    """
+    Forecast `materials` and write the artifact to `output_dir`.
+
+    Without `materials` the whole catalog is forecast. Otherwise only the given
+    materials are recomputed and all other series of an existing artifact are
+    carried over unchanged.
+
+    Returns:
+        dict: The manifest that was written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cache = ForecastCache(model_registry=registry, max_horizon=horizon)
+    series = read_artifact(output_dir) if materials is not None else {}
+    pairs = []
+    for material in catalog if materials is None else materials:
+        pair = (material.model, material.csv)
+        if pair in pairs:
+            continue
+        if not cache.available(*pair):
+            logger.warning("Skipping %s: model or history file is missing", material.name)
+            continue
+        pairs.append(pair)
+
+    for model_name, csv_file_name in pairs:
+        start = time.perf_counter()
+        forecast = cache.get(model_name, csv_file_name)
+        entry = {"model": model_name, "csv": csv_file_name,
+                 "history_length": forecast.history_length, "horizon": forecast.horizon}
+        series[(model_name, csv_file_name)] = entry, series_records(forecast)
+        logger.info("Materialized %s in %.3fs", model_name, time.perf_counter() - start)
+
+    entries, arrays, offset = [], [], 0
+    for entry, records in series.values():
+        entries.append(dict(entry, offset=offset))
+        arrays.append(records)
+        offset += len(records)
+
+    # The manifest is replaced last, so readers never see it point at a partial array
+    values_name = f'forecasts-{time.time_ns()}.npy'
+    values = np.concatenate(arrays) if arrays else np.empty(0, dtype=RECORD_DTYPE)
+    write_atomic(os.path.join(output_dir, values_name), lambda f: np.save(f, values))
+    manifest = {
+        "created_at": time.time(),
+        "horizon": min((entry["horizon"] for entry in entries), default=horizon),
+        "values": values_name,
+        "series": entries,
+    }
+    write_atomic(os.path.join(output_dir, MANIFEST_NAME), lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+
+    # Arrays of earlier runs are no longer referenced; processes that still map one keep it alive
+    for file_name in os.listdir(output_dir):
+        if file_name.startswith('forecasts-') and file_name.endswith('.npy') and file_name != values_name:
+            os.remove(os.path.join(output_dir, file_name))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute material forecasts for FORECAST_SOURCE=materialized.")
+    parser.add_argument('--horizon', type=int, default=120, help="Months to forecast past the history (default 120)")
+    parser.add_argument('--output', default=MATERIALIZED_DIR, help="Directory of the artifact (default materialized)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    manifest = materialize(args.output, args.horizon)
+    print(f"Materialized {len(manifest['series'])} forecasts for {manifest['horizon']} months into {args.output}")
+
+
+if __name__ == '__main__':
+    main()
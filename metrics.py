@@ -0,0 +1,223 @@
+#
+# SPDX-FileName: metrics.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Process-local metrics in the Prometheus text exposition format.
+
+Stages of the pricing path are timed with `stage` or `timed` into a single
+histogram labelled by stage and model. Values owned by other components, such
+as cache hit counts and model sizes, are read through collectors when the
+metrics are rendered. Each uvicorn worker process keeps its own metrics.
+"""
+
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Fraction of pricing calls run under cProfile, and the duration above which their profile is logged
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_SECONDS = float(os.environ.get('PROFILE_SLOW_SECONDS', 1.0))
+_profiling = threading.local()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+class Metric:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _labels(self, key, **extra):
+        return dict(zip(self.labelnames, key), **extra)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + '_total', self._labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, then the total count and the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, counts in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((self.name + '_bucket', self._labels(key, le=repr(bound)), count))
+                samples.append((self.name + '_bucket', self._labels(key, le='+Inf'), counts[-2]))
+                samples.append((self.name + '_count', self._labels(key), counts[-2]))
+                samples.append((self.name + '_sum', self._labels(key), counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """
+        Register `collect()`, called on every render. It returns a list of
+        `(name, type, documentation, [(labels, value), ...])` tuples.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(f'{name}{_format_labels(labels)} {value}' for name, labels, value in metric.samples())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception:
+                logger.exception("Metrics collector %r failed", collect)
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                lines.extend(f'{name}{_format_labels(labels)} {value}' for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram('pricing_stage_seconds', "Duration of a stage of the pricing path.",
+                                  ('stage', 'model'))
+request_seconds = metrics.histogram('http_request_duration_seconds', "Duration of HTTP requests.",
+                                    ('method', 'path', 'status'))
+requests_in_flight = metrics.gauge('http_requests_in_flight', "HTTP requests currently being served.")
+
+
+@contextmanager
+def stage(name, model=''):
+    """Time the enclosed block as stage `name` of the pricing path."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name, model=model)
+
+
+def timed(name):
+    """Decorator timing every call of a function as stage `name`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profiled(function):
+    """
+    Decorator that runs a sample of calls under cProfile.
+
+    `PROFILE_SAMPLE_RATE` of the calls are profiled; the profile of a sampled
+    call that takes longer than `PROFILE_SLOW_SECONDS` is logged. Calls made
+    while the thread is already being profiled are part of the outer profile.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if (PROFILE_SAMPLE_RATE <= 0 or getattr(_profiling, 'active', False)
+                or random.random() >= PROFILE_SAMPLE_RATE):
+            return function(*args, **kwargs)
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        _profiling.active = True
+        profile.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+            _profiling.active = False
+            elapsed = time.perf_counter() - start
+            if elapsed > PROFILE_SLOW_SECONDS:
+                report = io.StringIO()
+                pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(25)
+                logger.warning("Slow call of %s took %.3fs:\n%s", function.__name__, elapsed, report.getvalue())
+    return wrapper
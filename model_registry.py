@@ -0,0 +1,169 @@
+#
+# SPDX-FileName: model_registry.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import logging
+import os
+import pickle
+import threading
+import time
+
+from metrics import stage_seconds
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = 'models'
+
+
+def current_rss():
+    """
+    Return the resident set size of the current process in bytes.
+
+    Returns 0 on platforms without /proc.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def parameter_bytes(model):
+    """Size in bytes of the torch parameters held by a fitted NeuralProphet model."""
+    network = getattr(model, 'model', None)
+    if network is None or not hasattr(network, 'parameters'):
+        return 0
+    return sum(p.numel() * p.element_size() for p in network.parameters())
+
+
+class LoadedModel:
+    """A model held by the registry together with what it cost to load it."""
+
+    def __init__(self, name, model, signature, load_seconds, file_bytes, rss_delta_bytes):
+        self.name = name
+        self.model = model
+        self.signature = signature
+        self.load_seconds = load_seconds
+        self.file_bytes = file_bytes
+        self.rss_delta_bytes = rss_delta_bytes
+        self.parameter_bytes = parameter_bytes(model)
+        self.loaded_at = time.time()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "file_bytes": self.file_bytes,
+            "parameter_bytes": self.parameter_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+        }
+
+
+class ModelRegistry:
+    """
+    In-process registry of the NeuralProphet models in `models/`.
+
+    Every pickle is unpickled and has its trainer restored once, after which the
+    model is shared read-only by all requests. On each lookup the pickle's mtime
+    and size are compared with the loaded copy; when the file changed, the new
+    model is loaded off to the side and swapped in atomically, so in-flight
+    requests keep the model they started with.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR):
+        self.models_dir = models_dir
+        self._entries = {}
+        self._failed = {}
+        self._load_lock = threading.Lock()
+        self._model_locks = {}
+        self._model_locks_lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.models_dir, name + '.pkl')
+
+    def lock(self, name):
+        """
+        Lock to hold while running model `name`.
+
+        A NeuralProphet model keeps per-call state on its trainer, so two threads
+        must never predict with the same model at once.
+        """
+        with self._model_locks_lock:
+            return self._model_locks.setdefault(name, threading.Lock())
+
+    def available(self):
+        """Names of all models with a pickle on disk."""
+        if not os.path.isdir(self.models_dir):
+            return []
+        return sorted(file_name[:-len('.pkl')] for file_name in os.listdir(self.models_dir)
+                      if file_name.endswith('.pkl'))
+
+    def signature(self, name):
+        """(mtime_ns, size) of the pickle for `name`; changes whenever the file is replaced."""
+        stat = os.stat(self.path(name))
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self, name, signature):
+        path = self.path(name)
+        rss_before = current_rss()
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+        # The pickled metrics logger writes TensorBoard files to the directory the model was trained in
+        model.metrics = False
+        model.restore_trainer()
+        load_seconds = time.perf_counter() - start
+        stage_seconds.observe(load_seconds, stage='load_model', model=name)
+        # RSS delta is only indicative when other threads allocate concurrently
+        rss_delta = max(current_rss() - rss_before, 0)
+        logger.info("Loaded model %s in %.3fs", name, load_seconds)
+        return LoadedModel(name, model, signature, load_seconds, signature[1], rss_delta)
+
+    def get(self, name):
+        """
+        Return the loaded model `name`, (re)loading it if the pickle changed.
+
+        Raises:
+            FileNotFoundError: if there is no pickle for `name`.
+        """
+        signature = self.signature(name)
+        entry = self._entries.get(name)
+        if entry is not None and entry.signature == signature:
+            return entry.model
+
+        with self._load_lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.signature == signature:
+                return entry.model
+            if entry is not None and self._failed.get(name) == signature:
+                return entry.model
+            try:
+                new_entry = self._load(name, signature)
+            except Exception:
+                if entry is None:
+                    raise
+                # A half-written or broken pickle must not take the model offline
+                logger.exception("Reloading model %s failed, keeping the previous version", name)
+                self._failed[name] = signature
+                return entry.model
+            self._entries[name] = new_entry
+            self._failed.pop(name, None)
+        return new_entry.model
+
+    def load_all(self):
+        """Load and warm every model on disk; failures are logged, not raised."""
+        for name in self.available():
+            try:
+                self.get(name)
+            except Exception:
+                logger.exception("Could not load model %s", name)
+
+    def stats(self):
+        return [entry.stats() for entry in sorted(self._entries.values(), key=lambda e: e.name)]
+
+
+registry = ModelRegistry()
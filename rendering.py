@@ -0,0 +1,95 @@
+#
+# SPDX-FileName: rendering.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import io
+import os
+import threading
+from collections import OrderedDict
+
+# Upper bound for the rendered charts kept in memory per worker process
+PLOT_CACHE_BYTES = int(os.environ.get('PLOT_CACHE_BYTES', 32 * 1024 * 1024))
+MEDIA_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+def render_chart(dates, values, image_format='png'):
+    """
+    Render the product price forecast as an image.
+
+    A standalone Figure on the Agg canvas is used instead of pyplot, so nothing
+    is registered in pyplot's global figure list and concurrent requests do not
+    share drawing state.
+
+    Args:
+        dates (list): Month labels.
+        values (list): Total product value per month.
+        image_format (str): 'png' or 'svg'.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    try:
+        axes = figure.add_subplot()
+        axes.plot(dates, values, marker='o', color='b')
+        axes.set_title('Product Price Forecast')
+        axes.set_xlabel('Date')
+        axes.set_ylabel('Total Product Value')
+        axes.tick_params(axis='x', labelrotation=45)
+        for label in axes.get_xticklabels():
+            label.set_horizontalalignment('right')
+        figure.tight_layout()
+
+        buf = io.BytesIO()
+        figure.savefig(buf, format=image_format)
+        return buf.getvalue()
+    finally:
+        figure.clear()
+
+
+class ChartCache:
+    """Least recently used cache of rendered charts, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes=PLOT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._charts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            chart = self._charts.get(key)
+            if chart is None:
+                self.misses += 1
+                return None
+            self._charts.move_to_end(key)
+            self.hits += 1
+            return chart
+
+    def put(self, key, chart):
+        if len(chart) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._charts.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._charts[key] = chart
+            self.size += len(chart)
+            while self.size > self.max_bytes:
+                _, evicted = self._charts.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self):
+        return {"charts": len(self._charts), "bytes": self.size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+chart_cache = ChartCache()
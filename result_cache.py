@@ -0,0 +1,115 @@
+#
+# SPDX-FileName: result_cache.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# How long a priced BOM is reused and may be cached by clients, and how many are kept per worker process
+RESULT_CACHE_SECONDS = float(os.environ.get('RESULT_CACHE_SECONDS', 30))
+RESULT_CACHE_ENTRIES = int(os.environ.get('RESULT_CACHE_ENTRIES', 1024))
+
+
+def etag(key):
+    """Strong entity tag of the result for a cache key."""
+    return '"' + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + '"'
+
+
+def not_modified(if_none_match, tag):
+    """Whether an If-None-Match header matches the entity tag `tag`."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or any(candidate.removeprefix('W/') == tag for candidate in candidates)
+
+
+class ResultCache:
+    """
+    Single-flight cache of results with a short time to live.
+
+    Concurrent calls for the same key wait for the first one to compute the
+    result and share it; the result is then reused until it expires. Errors are
+    passed to every waiting caller and are not cached. Callers wait on the
+    event loop, so hits and waits for an identical call take no thread.
+    """
+
+    def __init__(self, ttl=RESULT_CACHE_SECONDS, max_entries=RESULT_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._results = OrderedDict()
+        self._pending = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def _begin(self, key):
+        """`('hit', result)`, or `('wait', future)` / `('lead', future)` with the future of the result to wait for or set."""
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._results.move_to_end(key)
+                self.hits += 1
+                return 'hit', entry[1]
+            future = self._pending.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return 'wait', future
+            future = self._pending[key] = Future()
+            self.misses += 1
+        return 'lead', future
+
+    def _fail(self, key, future, error):
+        with self._lock:
+            del self._pending[key]
+        future.set_exception(error)
+
+    def _store(self, key, future, result):
+        with self._lock:
+            if self.ttl > 0:
+                self._results[key] = (time.monotonic() + self.ttl, result)
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+            del self._pending[key]
+        future.set_result(result)
+
+    async def _lead(self, key, future, compute):
+        try:
+            result = await compute()
+        except BaseException as e:
+            self._fail(key, future, e)
+        else:
+            self._store(key, future, result)
+
+    async def get_async(self, key, compute):
+        """
+        The result for `key`, computed by the coroutine function `compute` on a miss.
+
+        It is computed in a task of its own, so a caller that gives up,
+        e.g. because its client disconnected, does not fail the others waiting
+        for it.
+        """
+        state, value = self._begin(key)
+        if state == 'hit':
+            return value
+        if state == 'lead':
+            task = asyncio.ensure_future(self._lead(key, value, compute))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(asyncio.wrap_future(value))
+
+    def stats(self):
+        return {"results": len(self._results), "ttl_seconds": self.ttl, "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+
+result_cache = ResultCache()
@@ -0,0 +1,140 @@
+#
+# SPDX-FileName: scenarios.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Monte Carlo price-risk bands of a bill of materials.
+
+The error of each material forecast is taken from its history: the relative
+residual `y / yhat1 - 1` of every month in `data/*.csv` against the historic
+part of the forecast. A price path compounds one shock per forecast month, the
+month-over-month change of the log residual ratio `log(y / yhat1)`, so the
+error of a path builds up and the bands widen with the horizon. Shocks are
+drawn jointly, as whole historic months of all materials of the BOM, so the
+draws keep the empirical correlation and the tails of the changes. The paths
+are simulated a few months at a time, carrying their accumulated shocks over,
+so memory stays bounded however many scenarios and months are asked for.
+"""
+
+import threading
+
+import numpy as np
+
+from catalog import catalog
+from forecast_cache import forecast_cache
+from metrics import timed
+from utili import bom_matrices
+
+DEFAULT_SCENARIOS = 10000
+MAX_SCENARIOS = 100000
+QUANTILES = (10, 50, 90)
+# Fewest month-over-month shocks observed for all materials of a BOM that the paths are drawn from
+MIN_RESIDUAL_MONTHS = 12
+# Scenario shocks held at once (8 MB); the months are simulated in chunks of this size
+SCENARIO_CHUNK_CELLS = 1 << 20
+
+_residuals = {}
+_residuals_lock = threading.Lock()
+
+
+def shocks(material):
+    """
+    Month-over-month changes of the log residual ratio of `material`.
+
+    Only changes between consecutive calendar months are kept.
+
+    Returns:
+        pandas.Series: `log(y / yhat1)` minus its value one month earlier, indexed by month.
+    """
+    import pandas as pd
+
+    ratios = np.log1p(residuals(material))
+    previous = ratios.shift(1, freq=pd.DateOffset(months=1))
+    return (ratios - previous).dropna()
+
+
+def residuals(material):
+    """
+    Relative residuals of the forecast of `material` over its history.
+
+    Returns:
+        pandas.Series: `y / yhat1 - 1`, indexed by month.
+    """
+    import pandas as pd
+
+    signature = forecast_cache.signature(material.model, material.csv)
+    cached = _residuals.get(material.name)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    _, full_projected_values = forecast_cache.projection(material.model, material.csv, 1)
+    fitted = full_projected_values.iloc[:-1].set_index('ds')['yhat1']
+    history = pd.read_csv(forecast_cache.csv_path(material.csv), parse_dates=['ds'])
+    observed = history.set_index('ds')['y']
+    observed, fitted = observed.align(fitted, join='inner')
+    series = (observed / fitted - 1).dropna().sort_index()
+    series.name = material.name
+    with _residuals_lock:
+        _residuals[material.name] = (signature, series)
+    return series
+
+
+@timed('simulate_scenarios')
+def simulate(args, scenarios=DEFAULT_SCENARIOS, quantiles=QUANTILES, seed=None):
+    """
+    Quantile bands of the product price of one BOM over simulated price paths.
+
+    Every scenario draws one historic month of shocks per forecast month, with
+    replacement, and compounds them: the price of a material in a month is its
+    forecast times the exponential of the sum of its shocks up to that month.
+    The shocks of each material are centered, so the paths scatter around the
+    point forecast instead of drifting away from it.
+
+    Args:
+        args (dict): Validated argument dict as built for `product_estimate_price`.
+        scenarios (int): Number of simulated price paths.
+        quantiles (tuple): Percentiles to report.
+        seed (int): Seed of the random draws, for reproducible bands.
+
+    Returns:
+        list: Per month, the point forecast `total_product_value` and one `p<q>`
+        entry per percentile.
+
+    Raises:
+        ValueError: if the materials of the BOM share fewer than
+        `MIN_RESIDUAL_MONTHS` months of history.
+    """
+    import pandas as pd
+
+    materials, (dates,), prices, weights, horizons = bom_matrices([args])
+    months = horizons[0]
+    frame = pd.concat([shocks(catalog[material]) for material in materials], axis=1, join='inner')
+    if len(frame) < MIN_RESIDUAL_MONTHS:
+        raise ValueError(f"The materials share only {len(frame)} months of history, "
+                         f"at least {MIN_RESIDUAL_MONTHS} are needed.")
+    history = frame.to_numpy()
+    history = history - history.mean(axis=0)
+
+    # Weighted prices per month and material; a path scales each of them by its accumulated shock
+    weighted = (weights[0][:, None] * prices[:, :months]).T
+    totals = weighted.sum(axis=1)
+
+    rng = np.random.default_rng(seed)
+    bands = np.empty((len(quantiles), months))
+    accumulated = np.zeros((scenarios, len(materials)))
+    chunk = max(1, SCENARIO_CHUNK_CELLS // (scenarios * len(materials)))
+    for start in range(0, months, chunk):
+        stop = min(start + chunk, months)
+        drawn = rng.integers(len(frame), size=(stop - start, scenarios), dtype=np.intp)
+        paths = np.cumsum(history[drawn], axis=0)
+        paths += accumulated
+        accumulated = paths[-1].copy()
+        np.exp(paths, out=paths)
+        paths = np.einsum('msk,mk->ms', paths, weighted[start:stop])
+        bands[:, start:stop] = np.percentile(paths, quantiles, axis=1)
+
+    return [dict({'ds': ds, 'total_product_value': float(total)},
+                 **{f'p{q}': float(band) for q, band in zip(quantiles, bands[:, month])})
+            for month, (ds, total) in enumerate(zip(dates[:months], totals))]
@@ -0,0 +1,184 @@
+#
+# SPDX-FileName: serving.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+Admission control for the CPU-heavy endpoints.
+
+In the default `threadpool` mode heavy work runs on the server's shared
+threadpool, as before. In `async` mode it is dispatched to a dedicated pool of
+`SERVING_WORKERS` threads. At most `SERVING_QUEUE` requests may wait for a
+worker, and each may wait for at most `SERVING_DEADLINE_SECONDS`. Requests
+that find the queue full, or whose deadline passes before a worker picks them
+up, are answered at once with 503 and a Retry-After estimated from the queue
+depth. The items of a streamed response are produced on the same workers once
+its request was admitted, so a stream is never cut short by a 503. Cheap
+endpoints such as /status, and answers found in a cache, never touch the
+queue, so they stay responsive however busy the workers are.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+SERVING_MODE = os.environ.get('SERVING_MODE', 'threadpool')
+# Threads for heavy work, requests allowed to wait for them and how long each may wait
+SERVING_WORKERS = int(os.environ.get('SERVING_WORKERS', min(4, os.cpu_count() or 1)))
+SERVING_QUEUE = int(os.environ.get('SERVING_QUEUE', 32))
+SERVING_DEADLINE_SECONDS = float(os.environ.get('SERVING_DEADLINE_SECONDS', 10))
+
+
+class WorkQueue:
+    """
+    Bounded queue in front of a bounded executor.
+
+    Requests are served first come, first served. Every request has a deadline
+    for leaving the queue; once a worker has started on a request it runs to
+    completion.
+    """
+
+    mode = 'async'
+
+    def __init__(self, workers=SERVING_WORKERS, queue_size=SERVING_QUEUE, deadline=SERVING_DEADLINE_SECONDS):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.queued = 0
+        self.running = 0
+        self.rejected = 0
+        self.expired = 0
+        # Moving average of the time a request holds a worker, for Retry-After
+        self.service_seconds = 1.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='serving')
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until the work queued now is expected to be done, at least one."""
+        with self._lock:
+            backlog = self.queued + self.running
+        return max(1, math.ceil(backlog * self.service_seconds / self.workers))
+
+    def _overloaded(self, reason):
+        return HTTPException(status_code=503, detail=f"The service is overloaded: {reason}. Please retry later.",
+                             headers={"Retry-After": str(self.retry_after())})
+
+    def _dequeued(self, future):
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def _start(self, deadline, fn, args):
+        with self._lock:
+            self.queued -= 1
+            if time.monotonic() > deadline:
+                self.expired += 1
+                expired = True
+            else:
+                self.running += 1
+                expired = False
+        if expired:
+            raise self._overloaded("the request waited longer than its deadline")
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.running -= 1
+                self.service_seconds += 0.2 * (elapsed - self.service_seconds)
+
+    async def run(self, fn, *args):
+        """
+        Run `fn(*args)` on a worker and return its result.
+
+        Raises:
+            HTTPException: 503 with Retry-After if the queue is full or the
+                request is still waiting when its deadline passes.
+        """
+        with self._lock:
+            if self.queued >= self.queue_size:
+                self.rejected += 1
+                full = True
+            else:
+                self.queued += 1
+                full = False
+        if full:
+            raise self._overloaded("too many requests are waiting")
+
+        deadline = time.monotonic() + self.deadline
+        future = self._executor.submit(self._start, deadline, fn, args)
+        future.add_done_callback(self._dequeued)
+        result = asyncio.wrap_future(future)
+        try:
+            done, _ = await asyncio.wait({result}, timeout=max(0.0, deadline - time.monotonic()))
+            if not done and future.cancel():
+                with self._lock:
+                    self.expired += 1
+                raise self._overloaded("the request waited longer than its deadline")
+            return await result
+        except asyncio.CancelledError:
+            # A request given up on, e.g. by a disconnected client, leaves the queue
+            future.cancel()
+            raise
+
+    def _next(self, iterator, end):
+        with self._lock:
+            self.running += 1
+        try:
+            return next(iterator, end)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def iterate(self, iterator):
+        """
+        Items of `iterator`, each produced on a worker.
+
+        For the body of a response whose request was admitted by `run`; the
+        items skip the queue, so a stream that started is always completed.
+        """
+        end = object()
+        while True:
+            future = self._executor.submit(self._next, iterator, end)
+            try:
+                item = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            if item is end:
+                return
+            yield item
+
+    def stats(self):
+        capacity = self.workers + self.queue_size
+        return {"mode": self.mode, "workers": self.workers, "queue_size": self.queue_size,
+                "deadline_seconds": self.deadline, "queue_depth": self.queued, "running": self.running,
+                "saturation": round((self.queued + self.running) / capacity, 3),
+                "saturated": self.queued >= self.queue_size, "rejected": self.rejected, "expired": self.expired,
+                "retry_after_seconds": self.retry_after()}
+
+
+class ThreadpoolQueue:
+    """Runs heavy work on the server's shared threadpool, without admission control."""
+
+    mode = 'threadpool'
+
+    async def run(self, fn, *args):
+        return await run_in_threadpool(fn, *args)
+
+    def iterate(self, iterator):
+        return iterate_in_threadpool(iterator)
+
+    def stats(self):
+        return {"mode": self.mode}
+
+
+work_queue = WorkQueue() if SERVING_MODE == 'async' else ThreadpoolQueue()
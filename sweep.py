@@ -0,0 +1,119 @@
+#
+# SPDX-FileName: sweep.py
+# SPDX-FileCopyrightText: Copyright 2010 - 2025 Software GmbH, Darmstadt, Germany and/or its subsidiaries and/or its affiliates
+# SPDX-License-Identifier: Apache-2.0
+#
+
+"""
+What-if sweeps over weights, spot prices and horizons.
+
+The price of a product is linear in the material weights, and rescaling a
+forecast to a spot price is a constant factor, so every point of the grid is
+priced with the same (materials x months) matrix of cached forecasts. The
+grid is the Cartesian product of the values of all parameters, in the order
+they are given, and is priced in chunks so large grids can be streamed.
+"""
+
+import os
+
+import numpy as np
+
+from catalog import DEFAULT_MONTHS, catalog
+from utili import bom_matrices, validate_arguments
+
+# Largest grid accepted in one call and grid points priced per chunk
+SWEEP_MAX_POINTS = int(os.environ.get('SWEEP_MAX_POINTS', 1000000))
+SWEEP_CHUNK_POINTS = 1000
+
+
+def parameter_values(value):
+    """
+    Values of one sweep parameter: a number, a list of numbers, or a range given
+    as `{"start", "stop", "step"}` (stop included when it is on the step) or
+    `{"start", "stop", "num"}` (evenly spaced, both ends included).
+    """
+    if isinstance(value, dict):
+        start, stop = float(value['start']), float(value['stop'])
+        if value.get('num') is not None:
+            return np.linspace(start, stop, int(value['num']))
+        if value.get('step') is None:
+            raise ValueError("A range needs either a step or a number of values.")
+        step = float(value['step'])
+        if step <= 0 or stop < start:
+            raise ValueError("A range needs start <= stop and a positive step.")
+        if (stop - start) / step >= SWEEP_MAX_POINTS:
+            raise ValueError(f"A range has more than {SWEEP_MAX_POINTS} values.")
+        # Half a step of slack keeps a stop that is on the step despite rounding
+        return np.arange(start, stop + step / 2, step)
+    values = np.atleast_1d(np.asarray(value, dtype=float))
+    if values.ndim != 1 or not len(values):
+        raise ValueError("A parameter needs a number, a non-empty list of numbers or a range.")
+    return values
+
+
+class Sweep:
+    """
+    A validated grid of parameter values.
+
+    Attributes:
+        axes (dict): Argument name to the array of its values, in grid order.
+        shape (tuple): Number of values per axis.
+    """
+
+    def __init__(self, parameters):
+        axes = {argument: parameter_values(value) for argument, value in catalog.arguments(parameters).items()}
+        if not any(argument in catalog for argument in axes):
+            raise ValueError("No material weights were provided.")
+        months = axes.setdefault('months', np.array([DEFAULT_MONTHS], dtype=float))
+        if (months < 1).any() or (months != np.round(months)).any():
+            raise ValueError("months must be positive integers.")
+        axes['months'] = months.astype(int)
+        self.axes = axes
+        self.shape = tuple(len(values) for values in axes.values())
+        if self.size > SWEEP_MAX_POINTS:
+            raise ValueError(f"The grid has {self.size} points, at most {SWEEP_MAX_POINTS} are accepted.")
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def corner(self):
+        """One grid point with the longest horizon, for validation and the forecast matrix."""
+        corner = {argument: float(values[0]) for argument, values in self.axes.items()}
+        corner['months'] = int(self.axes['months'].max())
+        return corner
+
+
+def price_sweep(sweep):
+    """
+    Price every point of a sweep.
+
+    Returns:
+        tuple: The month labels of the longest horizon, and an iterator of
+        `(offset, totals)` chunks in row-major grid order, where `totals` is a
+        list holding the monthly prices of each grid point, cut to its horizon.
+    """
+    corner = sweep.corner()
+    validate_arguments(corner)
+    # Unit weights and spot prices give the price per kg and per unit of spot price of each material
+    unit = {argument: 1.0 for argument in sweep.axes if argument != 'months'}
+    unit['months'] = corner['months']
+    materials, (dates,), prices, weights, _ = bom_matrices([unit])
+    factors = weights[0]
+    names = list(sweep.axes)
+
+    def chunks():
+        for offset in range(0, sweep.size, SWEEP_CHUNK_POINTS):
+            # Grid coordinates of the chunk; each axis value is broadcast to the points that use it
+            index = np.unravel_index(np.arange(offset, min(offset + SWEEP_CHUNK_POINTS, sweep.size)), sweep.shape)
+            values = {name: sweep.axes[name][axis_index] for name, axis_index in zip(names, index)}
+            coefficients = np.empty((len(index[0]), len(materials)))
+            for column, material in enumerate(materials):
+                coefficients[:, column] = values[material] * factors[column]
+                if f'p_{material}' in values:
+                    coefficients[:, column] *= values[f'p_{material}']
+            # Prices in cents keep the streamed JSON compact
+            totals = np.round(coefficients @ prices, 2)
+            yield offset, [row[:months].tolist() for row, months in zip(totals, values['months'])]
+
+    return dates, chunks()
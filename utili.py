@@ -4,246 +4,167 @@
 # SPDX-License-Identifier: Apache-2.0
 #
 
-import pickle
 import json
-import neuralprophet
-import pandas as pd
-import matplotlib.pyplot as plt
-import io
-import base64
-from fastapi.responses import StreamingResponse
+import numpy as np
+from fastapi.responses import Response
 from fastapi import HTTPException
-
-def plot_predictions(predictions):
+from catalog import catalog, DEFAULT_MONTHS
+from forecast_cache import forecast_cache
+from metrics import profiled, stage, timed
+from model_registry import registry
+from rendering import chart_cache, render_chart, MEDIA_TYPES
+
+@timed('plot_predictions')
+def plot_predictions(predictions, image_format='png'):
     """
     Plot the predictions over time.
 
     Args:
         predictions (list): A list of dictionaries with 'ds' and 'total_product_value' keys.
+        image_format (str): 'png' or 'svg'.
     """
     # Extract dates and values from the predictions list
     dates = [entry['ds'] for entry in predictions]
     values = [entry['total_product_value'] for entry in predictions]
-    
-    # Create the plot
-    plt.figure(figsize=(10, 6))
-    plt.plot(dates, values, marker='o', color='b')
-    plt.title('Product Price Forecast')
-    plt.xlabel('Date')
-    plt.ylabel('Total Product Value')
-    plt.xticks(rotation=45, ha="right")
-    plt.tight_layout()
-    
-    # Save plot to an in-memory buffer
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    
-    # Return the image as a StreamingResponse
-    return StreamingResponse(buf, media_type="image/png")
-
+    return Response(content=render_chart(dates, values, image_format), media_type=MEDIA_TYPES[image_format])
+
+def bom_key(args):
+    """Cache key of a priced BOM: the normalized BOM and horizon and the forecasts it is priced from."""
+    arguments = tuple(sorted((key, float(value)) for key, value in args.items() if key != 'months'))
+    forecasts = tuple(forecast_cache.signature(catalog[key].model, catalog[key].csv)
+                      for key, _ in arguments if key in catalog)
+    return arguments, args.get('months', DEFAULT_MONTHS), forecasts
+
+def chart_key(args, image_format):
+    """Cache key of a chart: the key of its BOM and the format."""
+    return bom_key(args) + (image_format,)
+
+def cached_chart(key, image_format):
+    """The chart response for `key` if it is in the chart cache, else None."""
+    chart = chart_cache.get(key)
+    if chart is None:
+        return None
+    return Response(content=chart, media_type=MEDIA_TYPES[image_format])
+
+@profiled
+def draw_chart(args, image_format, key):
+    """Draw the chart of the product forecast for `args` and add it to the chart cache under `key`."""
+    response = plot_predictions(product_estimate_price(args), image_format)
+    chart_cache.put(key, response.body)
+    return response
 
 def validate_arguments(args):
-    # Define non-material keys
-    non_material_keys = {"labour_hours", "alu", "months","copper"}
-    # Collect spot price and material weight keys, excluding non-materials
-    spot_price_keys = [key for key in args if key.startswith('p_') and key[2:] not in non_material_keys]
-    material_keys = [key for key in args if key not in non_material_keys and not key.startswith('p_')]
-    print(material_keys)
+    validate_spot_prices(args)
+    validate_available([key for key in args if key in catalog], args.get('months', DEFAULT_MONTHS))
+
+def validate_spot_prices(args):
+    material_keys = [key for key in args if key in catalog]
+    spot_price_keys = [key for key in args if catalog.spot_material(key) is not None]
     # Check if all spot prices have corresponding material weights
     for spot_price_key in spot_price_keys:
         material_key = spot_price_key[2:]  # Strip 'p_' to get the material key
         if material_key not in material_keys:
             raise HTTPException(status_code=400, detail=f"Weight for {material_key} is missing while its spot price is provided.")
 
-    # If any material has a spot price, all others must have spot prices if they exist
+    # If any material has a spot price, all others that accept one must have spot prices
     if spot_price_keys:
         for material_key in material_keys:
-            if f"p_{material_key}" not in spot_price_keys and args[material_key] is not None:
+            if catalog[material_key].spot_price and f"p_{material_key}" not in spot_price_keys:
                 raise HTTPException(status_code=400, detail=f"Spot price for {material_key} is missing while other materials have spot prices.")
 
-def load_model(name):
-    model_path = 'models' + '/' + name + '.pkl'
-    with open(model_path, 'rb') as f:
-        m = pickle.load(f)
-    return m
-
-def adjust_spot_price(full_projected_values, spot_price):
-    # assume spot date = 1/2023
-    target_date = '2023-01-01'
-    target_yhat1 = full_projected_values.loc[full_projected_values['ds'] == target_date, 'yhat1'].values[0]
-    full_projected_values['recalculated_yhat1'] = (full_projected_values['yhat1'] / target_yhat1) * spot_price
-    # Replace the original yhat1 column with the recalculated values
-    full_projected_values['yhat1'] = full_projected_values['recalculated_yhat1']
+def validate_available(material_keys, months):
+    """Check that every material of `material_keys` has a forecast for `months` months."""
+    for material_key in material_keys:
+        material = catalog[material_key]
+        if not forecast_cache.available(material.model, material.csv):
+            raise HTTPException(status_code=400, detail=f"No forecasting model is available for {material_key}.")
 
-    # Drop the recalculated_yhat1 column as it's no longer needed
-    full_projected_values.drop(columns=['recalculated_yhat1'], inplace=True)
-    return full_projected_values
+    # Materialized forecasts cannot be extended past the horizon they were written with
+    if not forecast_cache.live and material_keys and months > forecast_cache.max_horizon:
+        raise HTTPException(status_code=400, detail=f"Forecasts are available for at most {forecast_cache.max_horizon} months.")
 
-def porphet_predict(model_name, csv_file_name, forecasting_period = 24):
-    prophet_model = load_model(model_name)
-    prophet_model.restore_trainer()
-    data_file_path = 'data' + '/' + csv_file_name + '.csv'
-    data_file = pd.read_csv(data_file_path)
-    df_future = prophet_model.make_future_dataframe(data_file, periods=forecasting_period, n_historic_predictions=True)
-    # Predict the future
-    forecast = prophet_model.predict(df_future)
+def load_model(name):
+    # Models are unpickled and warmed once by the registry and shared across requests
+    return registry.get(name)
 
-    # get the months predicted values from yhat1
-    return forecast[['ds', 'yhat1']].tail(forecasting_period), forecast[['ds', 'yhat1']]
+def spot_reference(full_projected_values, forecasting_period):
+    # A spot price is taken to be the price of the latest observation in the history
+    history = full_projected_values.iloc[:len(full_projected_values) - forecasting_period]
+    return history.loc[history['ds'].idxmax(), 'yhat1']
 
+@timed('product_estimate_price')
+@profiled
 def product_estimate_price(args):
-    total_product_values = 0
-
-    if 'months' in args:
-        forecasting_period = args['months']
-    else:
-        # Default period would be 24 months (2 years)
-        forecasting_period = 24
-        
-    # Initialize an empty DataFrame to collect the 'ds' and 'yhat1' values
-    #total_product_df = pd.DataFrame()
-    
-
-    if 'copper' in args:
-        # use months as length of predicted values in the future
-        copper_predicted_values, copper_full_projected_values = porphet_predict(model_name='higher_copper',
-                                                                          csv_file_name='copper',
-                                                                          forecasting_period = forecasting_period)
-        copper_predicted_values.reset_index(drop= True, inplace = True)
-        copper_predicted_values['yhat1'] *= args['copper']
-        total_product_values += copper_predicted_values['yhat1'].squeeze()
-    # Predict aluminum price if alu_weight is provided
-    if 'alu' in args:
-        # use months as length of predicted values in the future
-        alu_predicted_values, alu_full_projected_values = porphet_predict(model_name='Aluminum_prophet',
-                                                                          csv_file_name='aluminum',
-                                                                          forecasting_period = forecasting_period)
-        alu_predicted_values.reset_index(drop= True, inplace = True)
-
-        alu_predicted_values['yhat1'] *= args['alu']
-        total_product_values += alu_predicted_values['yhat1'].squeeze()
-        
-    # Predict st37 price if st37_weight is provided
-    if 'st37' in args:
-        st37_predicted_values, st37_full_projected_values = porphet_predict(model_name='st37',
-                                                                            csv_file_name='st37',
-                                                                            forecasting_period = forecasting_period)
-        st37_predicted_values.reset_index(drop= True, inplace = True)
-            
-        # Adjust for the spot price if it is provided
-        if 'p_st37' in args:
-            st37_predicted_values = adjust_spot_price(st37_full_projected_values, args['p_st37']).tail(forecasting_period)
-            st37_predicted_values.reset_index(drop= True, inplace = True)
-            
-        st37_predicted_values['yhat1'] *= args['st37']
-        total_product_values += st37_predicted_values['yhat1'].squeeze()
-
-    # Predict labour cost if labour_hours is provided
-    if 'labour_hours' in args:
-        labour_predicted_cost, labour_full_projected_values = porphet_predict(model_name='labor_cost',
-                                                                              csv_file_name='labor_cost',
-                                                                              forecasting_period = forecasting_period)
-        labour_predicted_cost.reset_index(drop= True, inplace = True)
-
-        labour_predicted_cost['yhat1'] *= args['labour_hours']
-        total_product_values += labour_predicted_cost['yhat1']
+    # A single product is a batch of one
+    dates, totals, _ = batch_estimate_price([args])
+    return [{'ds': ds, 'total_product_value': value} for ds, value in zip(dates[0], totals[0].tolist())]
 
+@timed('batch_estimate_price')
+@profiled
+def batch_estimate_price(boms):
+    """
+    Price many bills of materials at once.
 
-    # Predict medium_carbon if labour_hours is provided
-    if 'medium_carbon' in args:
-        medium_carbon_predicted_cost, medium_carbon_full_projected_values = porphet_predict(model_name='medium_carbon',
-                                                                                                csv_file_name='medium_carbon',
-                                                                                                forecasting_period = forecasting_period)
-        medium_carbon_predicted_cost.reset_index(drop= True, inplace = True)
-        
-        # Adjust for the spot price if it is provided
-        if 'p_medium_carbon' in args:
-            medium_carbon_predicted_cost = adjust_spot_price(medium_carbon_full_projected_values,
-                                                             args['p_medium_carbon']).tail(forecasting_period)
-            medium_carbon_predicted_cost.reset_index(drop= True, inplace = True)
-        
-        medium_carbon_predicted_cost['yhat1'] *= args['medium_carbon']
-        total_product_values += medium_carbon_predicted_cost['yhat1']
-
-    # Predict high_carbon if labour_hours is provided
-    if 'high_carbon' in args:
-        high_carbon_predicted_cost, high_carbon_full_projected_values = porphet_predict(model_name='high_carbon',
-                                                                                        csv_file_name='high_carbon',
-                                                                                        forecasting_period = forecasting_period)
-        high_carbon_predicted_cost.reset_index(drop= True, inplace = True)
-        # Adjust for the spot price if it is provided
-        if 'p_high_carbon' in args:
-            high_carbon_predicted_cost = adjust_spot_price(high_carbon_full_projected_values,
-                                                           args['p_high_carbon']).tail(forecasting_period)
-            high_carbon_predicted_cost.reset_index(drop= True, inplace = True)
-        
-        high_carbon_predicted_cost['yhat1'] *= args['high_carbon']
-        total_product_values += high_carbon_predicted_cost['yhat1']
-
-    # Predict nonalloy_cast if labour_hours is provided
-    if 'nonalloy_cast' in args:
-        nonalloy_cast_predicted_cost, nonalloy_full_projected_values = porphet_predict(model_name='nonalloy_cast',
-                                                                                       csv_file_name='nonalloy_cast',
-                                                                                       forecasting_period = forecasting_period)
-        nonalloy_cast_predicted_cost.reset_index(drop= True, inplace = True)
-        
-        # Adjust for the spot price if it is provided
-        if 'p_nonalloy_cast' in args:
-            nonalloy_cast_predicted_cost = adjust_spot_price(nonalloy_full_projected_values,
-                                                      args['p_nonalloy_cast']).tail(forecasting_period)
-            nonalloy_cast_predicted_cost.reset_index(drop= True, inplace = True)
-        
-        nonalloy_cast_predicted_cost['yhat1'] *= args['nonalloy_cast']
-        total_product_values += nonalloy_cast_predicted_cost['yhat1']
-
-    # Predict grey_cast_iron if labour_hours is provided
-    if 'grey_cast_iron' in args:
-        grey_cast_iron_predicted_cost, grey_cast_full_projected_values = porphet_predict(model_name='grey_cast_iron',
-                                                                                         csv_file_name='grey_cast_iron',
-                                                                                         forecasting_period = forecasting_period)
-        grey_cast_iron_predicted_cost.reset_index(drop= True, inplace = True)
-        if 'p_grey_cast_iron' in args:
-            grey_cast_iron_predicted_cost = adjust_spot_price(grey_cast_full_projected_values, args['p_grey_cast_iron']).tail(forecasting_period)
-            grey_cast_iron_predicted_cost.reset_index(drop= True, inplace = True)
-            print('hey')
-        grey_cast_iron_predicted_cost['yhat1'] *= args['grey_cast_iron']
-        total_product_values += grey_cast_iron_predicted_cost['yhat1']
-
-    # Predict nodular_cast_iron if labour_hours is provided
-    if 'nodular_cast_iron' in args:
-        nodular_cast_iron_predicted_cost, nodular_cast_full_projected_values = porphet_predict(model_name='nodular_cast_iron',
-                                                                                               csv_file_name='nodular_cast_iron',
-                                                                                               forecasting_period=forecasting_period)
-        nodular_cast_iron_predicted_cost.reset_index(drop= True, inplace = True)
-        
-        # Adjust for the spot price if it is provided
-        if 'p_nodular_cast_iron' in args:
-            nodular_cast_iron_predicted_cost = adjust_spot_price(nodular_cast_full_projected_values, args['p_nodular_cast_iron']).tail(forecasting_period)
-            nodular_cast_iron_predicted_cost.reset_index(drop= True, inplace = True)
-        
-        nodular_cast_iron_predicted_cost['yhat1'] *= args['nodular_cast_iron']
-        total_product_values += nodular_cast_iron_predicted_cost['yhat1']
-
+    The totals of all BOMs are a single product of the weight and price matrices
+    of `bom_matrices`.
 
-    # Create a DataFrame with 'ds' column and 'total_product_value'
-    total_product_df = pd.DataFrame({'ds': alu_predicted_values['ds'] if 'alu_predicted_values' in locals()
-                                     else st37_predicted_values['ds'] if 'st37_predicted_values' in locals()
-                                     else labour_predicted_cost['ds'] if 'labour_predicted_cost' in locals()
-                                     else grey_cast_iron_predicted_cost['ds'] if 'grey_cast_iron_predicted_cost' in locals()
-                                     else nodular_cast_iron_predicted_cost['ds'] if 'nodular_cast_iron_predicted_cost' in locals()
-                                     else nonalloy_cast_predicted_cost['ds'] if 'nonalloy_cast_predicted_cost' in locals()
-                                     else medium_carbon_predicted_cost['ds'] if 'medium_carbon_predicted_cost' in locals()
-                                     else copper_predicted_values['ds'] if 'copper_predicted_values' in locals()
-                                     else high_carbon_predicted_cost['ds'],
-                                     'total_product_value': total_product_values})
+    Args:
+        boms (list): Validated argument dicts as built for `product_estimate_price`.
 
-    # Convert the 'ds' column to string format
-    total_product_df['ds'] = total_product_df['ds'].dt.strftime('%Y-%m')
+    Returns:
+        tuple: The month labels of each BOM for the longest horizon, an
+        (N x months) array of totals, and the number of months requested by
+        each BOM.
+    """
+    _, dates, prices, weights, horizons = bom_matrices(boms)
+    return dates, weights @ prices, horizons
 
-    # Convert the DataFrame to a dictionary format for API
-    result_dict = total_product_df.to_dict(orient='records')
-    return result_dict
+def bom_matrices(boms):
+    """
+    Weights and forecast prices of many bills of materials.
+
+    Each material forecast is fetched once for the longest requested horizon.
+    Weights are scaled by spot price where one is given, since rescaling a
+    forecast to a spot price is a constant factor per material. Each BOM is
+    labeled with the months of the first catalog material it uses, so its
+    labels do not depend on the other BOMs of the batch.
+
+    Returns:
+        tuple: The materials used by any BOM, the month labels of each BOM for
+        the longest horizon, the (materials x months) matrix of forecast prices, the
+        (N x materials) matrix of weights and the number of months requested by
+        each BOM.
+    """
+    horizons = [bom.get('months', DEFAULT_MONTHS) for bom in boms]
+    forecasting_period = max(horizons)
+    materials = [material.name for material in catalog if any(material.name in bom for bom in boms)]
+    if not materials:
+        raise HTTPException(status_code=400, detail="No material weights were provided.")
+
+    prices = np.empty((len(materials), forecasting_period))
+    references = np.empty(len(materials))
+    labels = []
+    projections = forecast_cache.projections([(catalog[material].model, catalog[material].csv) for material in materials],
+                                             forecasting_period)
+    for column, (material, (predicted_values, full_projected_values)) in enumerate(zip(materials, projections)):
+        prices[column] = predicted_values['yhat1'].to_numpy()
+        if any(f'p_{material}' in bom for bom in boms):
+            with stage('spot_rescaling', catalog[material].model):
+                references[column] = spot_reference(full_projected_values, forecasting_period)
+        labels.append(predicted_values['ds'].dt.strftime('%Y-%m').tolist())
+
+    weights = np.zeros((len(boms), len(materials)))
+    dates = []
+    for row, bom in enumerate(boms):
+        # A BOM is labeled with the months of its first material, as when it is priced alone
+        dates.append(next(labels[column] for column, material in enumerate(materials) if material in bom))
+        for column, material in enumerate(materials):
+            if material in bom:
+                weights[row, column] = bom[material]
+                if f'p_{material}' in bom:
+                    weights[row, column] *= bom[f'p_{material}'] / references[column]
+
+    return materials, dates, prices, weights, horizons
 
 def convert_json(df):
     json_data = {}